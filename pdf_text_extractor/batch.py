@@ -4,110 +4,1009 @@ Command-line interface for batch processing PDFs.
 
 import sys
 import os
+import re
+import asyncio
+import multiprocessing
+import queue
+import shutil
+import signal
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-import fitz  # PyMuPDF
-from dotenv import load_dotenv
-from .extractor import extract_pdf_text_with_mode, contains_api_error
-from .injector import inject_text_to_pdf
+from .extractor import extract_pdf_text_with_mode, extract_pdf_text_async, make_claude_async_client, contains_api_error, pdf_to_images, extraction_config_key, native_page_texts, vision_page_numbers, make_claude_client, make_gemini_client, make_render_pool, pdf_page_sizes, render_dpi, DEFAULT_DPI, DEFAULT_BATCH_PAGES, NATIVE_PDF_MIN_SHARE, JPEG_QUALITY
+from .injector import inject_text_to_pdf, PAGE_IMAGE_DPI, PAGE_IMAGE_JPEG_QUALITY
+from .ratelimit import TokenBucket
+from .utils import head_tail_bytes, fast_copy, get_spacy_layout, FITZ_LOCK
+from .cache import cached_pdf_sha256, text_cache_path, load_cached_text, store_cached_text, error_scan_cache, cached_pdf_info, has_cached_pdf_info, pdf_hash_cache, Checkpoint
 
-# Load environment variables from .env file
-load_dotenv()
+# One PDF as seen by scan_workload(): txt is the text output path,
+# output_pdf the file OCR writes and final_pdf where the searchable PDF
+# ends up, vision_pages the pages that will be sent to a vision API,
+# needs_reprocess is True when the PDF should go through the pipeline, and
+# has_text_layer marks born-digital PDFs that are kept as their own
+# searchable PDF instead of being OCR'd
+WorkItem = namedtuple('WorkItem', 'pdf txt output_pdf final_pdf page_count vision_pages needs_reprocess had_error has_text_layer')
 
 
-def find_pdfs(directory):
-    """Recursively find all PDF files in directory."""
-    path = Path(directory)
-    return sorted(path.rglob("*.pdf"))
+# Extensions of every file the batch reads or writes next to a PDF
+_OUTPUT_SUFFIXES = ('.pdf', '.md', '.txt')
 
 
-def estimate_cost(pdf_files, skip_existing=True, mode='claude'):
+def _walk_pdfs(directory, seen=None):
     """
-    Estimate the cost of processing PDFs.
+    Yield paths of PDF files under directory using os.scandir (no per-entry stat).
+
+    Matches the .pdf extension case-insensitively and skips directories
+    that can't be read. If seen is a set, the paths of all .pdf, .md and
+    .txt files found are added to it.
+    """
+    try:
+        entries = os.scandir(directory)
+    except PermissionError:
+        return
+    with entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from _walk_pdfs(entry.path, seen)
+                elif entry.is_file(follow_symlinks=False):
+                    name = entry.name.lower()
+                    if seen is not None and name.endswith(_OUTPUT_SUFFIXES):
+                        seen.add(entry.path)
+                    if name.endswith('.pdf'):
+                        yield entry.path
+            except PermissionError:
+                continue
+
+
+def find_pdfs(directory, sort=True, seen=None):
+    """
+    Recursively find all PDF files in directory.
+
+    Args:
+        directory: Root directory to search
+        sort: If False, return files in directory-walk order (faster on huge trees)
+        seen: Optional set that receives str() of every .pdf/.md/.txt path
+            found, for existence checks without a stat() per file
+    """
+    # Normalize the root so walked paths compare equal to str(Path(...))
+    pdf_files = [Path(p) for p in _walk_pdfs(str(Path(directory)), seen)]
+    if sort:
+        pdf_files.sort()
+    return pdf_files
+
+
+# Threads used for stat() calls, small reads and hashing over many files.
+# PyMuPDF is not thread-safe, so nothing that opens a PDF runs on them.
+IO_WORKERS = 32
+
+# PDFs missing from the page-count cache at which probing them is spread
+# over a process pool instead of opening them one after another
+PROBE_POOL_MIN_FILES = 64
+
+
+def _page_count(pdf_file):
+    """Open a PDF and return its page count."""
+    import fitz  # PyMuPDF
+    # page_count comes from the page tree without loading any pages;
+    # filetype skips content sniffing and the context manager closes on error
+    with FITZ_LOCK, fitz.open(str(pdf_file), filetype='pdf') as doc:
+        return doc.page_count
+
+
+def _resumed_from_checkpoint(checkpoint, pdf_file):
+    """
+    Return True if the checkpoint says pdf_file is already finished.
+
+    Unchanged files match on one stat(). The PDF is only hashed if its path
+    is in the checkpoint but the stat doesn't match.
+    """
+    try:
+        st = os.stat(pdf_file)
+    except OSError:
+        return False
+    if checkpoint.is_done(pdf_file, st=st):
+        return True
+    if not checkpoint.knows(pdf_file):
+        return False
+    return checkpoint.is_done(pdf_file, sha=_safe_sha256(pdf_file))
+
+
+def _record_complete(checkpoint, items):
+    """
+    Add PDFs whose outputs were found complete during the scan to the checkpoint.
+
+    The next run then skips them on a stat() without probing their outputs.
+    Uses the PDF hash only if one is already cached, so no PDF is read here.
+    """
+    for item in items:
+        try:
+            st = os.stat(item.pdf)
+        except OSError:
+            continue
+        checkpoint.add(item.pdf, pdf_hash_cache.get(item.pdf, st), st)
+
+
+def split_duplicates(work_items):
+    """
+    Find PDFs in the workload whose contents match another PDF's.
+
+    Only the first PDF of each group of identical files stays in the
+    workload; the others get needs_reprocess=False and receive copies of
+    its outputs once it is done, so each document is extracted once.
+
+    Returns:
+        (work_items, duplicates) where duplicates maps the path of each
+        representative PDF to the WorkItems of its copies
+    """
+    pending = [item.pdf for item in work_items if item.needs_reprocess]
+    if len(pending) < 2:
+        return work_items, {}
+    # Hashing only reads the files, nothing is parsed with PyMuPDF
+    with ThreadPoolExecutor(max_workers=IO_WORKERS) as executor:
+        hashes = dict(zip(pending, executor.map(_safe_sha256, pending)))
+
+    first = {}  # sha256 -> representative PDF
+    duplicates = {}
+    result = []
+    for item in work_items:
+        sha = hashes.get(item.pdf) if item.needs_reprocess else None
+        rep = first.setdefault(sha, item.pdf) if sha else item.pdf
+        if rep == item.pdf:
+            result.append(item)
+        else:
+            duplicates.setdefault(rep, []).append(item)
+            result.append(item._replace(needs_reprocess=False))
+    return result, duplicates
+
+
+def _copy_to_duplicates(opts, rep, dups):
+    """
+    Copy the finished outputs of rep to each of its identical PDFs.
+
+    Only outputs rep actually wrote are copied. A born-digital rep gets no
+    OCR'd PDF, and may get no copy either (see _keep_searchable()), so its
+    duplicates are passed through the same way instead.
+
+    Returns (copied, failures) with failures a list of (WorkItem, error).
+    """
+    copied, failures = 0, []
+    copy_txt = not opts['ocr_only'] and rep.txt.exists()
+    copy_pdf = not opts['skip_ocr'] and not rep.has_text_layer and rep.final_pdf.exists()
+    for dup in dups:
+        try:
+            if copy_txt:
+                fast_copy(rep.txt, dup.txt)
+            if copy_pdf:
+                fast_copy(rep.final_pdf, dup.final_pdf)
+            elif rep.has_text_layer and not opts['skip_ocr']:
+                _keep_searchable(dup, opts['overwrite'])
+        except OSError as e:
+            failures.append((dup, e))
+            continue
+        _mark_done(opts, dup.pdf)
+        copied += 1
+    return copied, failures
+
+
+def _safe_sha256(pdf_file):
+    """Return the (cached) SHA-256 of a PDF, or None if it can't be read."""
+    try:
+        return cached_pdf_sha256(pdf_file)
+    except OSError:
+        return None
+
+
+def _init_probe_worker():
+    """Process pool initializer for _probe_pdfs(): leave Ctrl-C handling to the main process."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _run_probe(probe, pdf_file):
+    """Return (True, probe(pdf_file)), or (False, None) if the probe raises."""
+    try:
+        return True, probe(pdf_file)
+    except Exception:
+        return False, None
+
+
+def _probe_pdfs(pdf_files, key, probe, default):
+    """
+    Return {pdf_file: probe(pdf_file)}, cached in pdf_info_cache under key.
+
+    PyMuPDF is not thread-safe, so the PDFs are opened in this thread, or in
+    a spawn process pool when at least PROBE_POOL_MIN_FILES of them are not
+    cached yet. PDFs that can't be read get default, which is not cached.
+    """
+    computed = {}
+    missing = [pdf_file for pdf_file in pdf_files if not has_cached_pdf_info(pdf_file, key)]
+    workers = os.cpu_count() or 1
+    if workers > 1 and len(missing) >= PROBE_POOL_MIN_FILES:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_probe_worker
+        ) as executor:
+            results = executor.map(_run_probe, [probe] * len(missing), missing, chunksize=16)
+            computed = dict(zip(missing, results))
+
+    def pooled_probe(pdf_file):
+        ok, value = computed[pdf_file] if pdf_file in computed else _run_probe(probe, pdf_file)
+        if not ok:
+            raise ValueError(f"Could not read {pdf_file}")
+        return value
+
+    counts = {}
+    for pdf_file in pdf_files:
+        try:
+            counts[pdf_file] = cached_pdf_info(pdf_file, key, pooled_probe)
+        except Exception:
+            counts[pdf_file] = default
+    return counts
+
+
+def count_pages(pdf_files):
+    """Count the pages of many PDFs. Returns {pdf_file: page_count}."""
+    if not pdf_files:
+        return {}
+    # Assume average of 5 pages if we can't open it
+    return _probe_pdfs(pdf_files, 'page_count', _page_count, 5)
+
+
+def _vision_page_count(pdf_file):
+    """Return (page_count, pages without usable embedded text) for a PDF."""
+    texts = native_page_texts(str(pdf_file))
+    return len(texts), texts.count(None)
+
+
+def count_vision_pages(pdf_files):
+    """
+    Count pages and the pages without usable embedded text.
+
+    These are the pages auto mode sends to the vision API, and the ones the
+    claude and gemini modes send for born-digital PDFs.
+
+    Returns {pdf_file: (page_count, vision_pages)}.
+    """
+    if not pdf_files:
+        return {}
+    probes = _probe_pdfs(pdf_files, 'vision_pages', _vision_page_count, (5, 5))
+    return {pdf_file: tuple(probe) for pdf_file, probe in probes.items()}
+
+
+def _output_paths(pdf_file, output_format, overwrite):
+    """
+    Return (main_output_file, output_pdf, final_pdf) for a PDF.
+
+    output_pdf is the file being written while the searchable PDF is created;
+    it only differs from final_pdf when overwriting.
+    """
+    # Determine output paths based on format
+    if output_format == 'markdown':
+        main_output_file = pdf_file.with_suffix('.md')
+    else:
+        main_output_file = pdf_file.with_suffix('.txt')
+
+    if overwrite:
+        # inject_text_to_pdf() writes beside the original, then replaces it
+        output_pdf = Path(f"{pdf_file}.tmp")
+        final_pdf = pdf_file
+    else:
+        # Create new file with _searchable suffix
+        output_pdf = pdf_file.with_stem(f"{pdf_file.stem}_searchable")
+        final_pdf = output_pdf
+
+    return main_output_file, output_pdf, final_pdf
+
+
+# Bytes read from each end of an output file when looking for API errors
+ERROR_SCAN_BYTES = 8192
+
+# First line of an output whose extraction had failed pages
+_WARNING_HEADER = '⚠️  WARNING:'.encode('utf-8')
+
+# Error note the extractor writes in place of text it could not get. Only
+# these lines are checked for API errors, so a document that merely quotes
+# one (e.g. a born-digital page about HTTP status codes) is not taken for a
+# failed extraction and reprocessed on every run.
+_ERROR_NOTE_RE = re.compile(rb'\[Error extracting (?:page \d+|text):[^\n]*')
+
+
+def _output_has_api_error(output_file):
+    """
+    Return True if an existing output file contains API errors.
+
+    Only the extractor's error notes are checked (see _ERROR_NOTE_RE), and
+    only in the first and last ERROR_SCAN_BYTES, since error
+    markers almost always appear near the start or end. Files whose header says pages
+    failed are scanned in full. Verdicts are cached by the file's
+    mtime and size, so unchanged files are not re-read on later runs.
+    Raises OSError/ValueError if the file can't be read.
+    """
+    st = os.stat(output_file)
+    has_error = error_scan_cache.get(output_file, st)
+    if has_error is None:
+        # Scanned as raw bytes: the error patterns are ASCII, so no decoding is needed
+        content = head_tail_bytes(output_file, head=ERROR_SCAN_BYTES, tail=ERROR_SCAN_BYTES)
+        if content.startswith(_WARNING_HEADER):
+            # Partial extraction: error text may be anywhere in the file
+            with open(output_file, 'rb') as f:
+                content = f.read()
+        has_error = any(contains_api_error(note.group()) for note in _ERROR_NOTE_RE.finditer(content))
+        error_scan_cache.put(output_file, st, has_error)
+    return has_error
+
+
+def _check_outputs(pdf_file, output_format, overwrite, ocr_only, skip_existing, existing=None):
+    """
+    Decide from a PDF's existing outputs whether it needs processing.
+
+    existing is the optional set of paths from find_pdfs(seen=...); when
+    given it answers the existence checks instead of stat() calls.
+
+    Returns (pdf_file, txt_file, output_pdf, final_pdf, needs_reprocess, had_error).
+    """
+    txt_file, output_pdf, final_pdf = _output_paths(pdf_file, output_format, overwrite)
+    if existing is None:
+        exists = Path.exists
+    else:
+        exists = lambda path: str(path) in existing
+    needs_reprocess = True
+    had_error = False
+
+    # Check if already processed
+    if not ocr_only and skip_existing and exists(txt_file):
+        # Check if the text file contains API errors
+        try:
+            if _output_has_api_error(txt_file):
+                # File has errors, need to reprocess
+                had_error = True
+            else:
+                # File is good, skip it
+                needs_reprocess = False
+        except Exception:
+            # Can't read file, better to reprocess
+            had_error = True
+
+    # Check if searchable PDF already exists
+    if needs_reprocess and skip_existing and final_pdf != pdf_file and exists(final_pdf):
+        needs_reprocess = False
+
+    return pdf_file, txt_file, output_pdf, final_pdf, needs_reprocess, had_error
+
+
+def scan_workload(pdf_files, skip_existing=True, output_format='markdown', overwrite=False, ocr_only=False, mode='claude', skip_searchable=False, existing=None, force_ocr=False):
+    """
+    Decide in a single pass which PDFs need processing.
+
+    Output paths are derived once here and carried on the WorkItem, so
+    later stages never recompute them. Each existing output file is checked
+    once, spread over a thread pool, and each PDF that needs work is opened
+    once to count its pages (see _probe_pdfs()).
 
     Args:
         pdf_files: List of PDF file paths
         skip_existing: Whether to skip files that already have output
-        mode: Extraction mode ('claude', 'gemini', 'spacy', or 'local')
+        output_format: 'markdown' (.md outputs) or 'plain' (.txt outputs)
+        overwrite: Whether searchable PDFs replace the originals
+        ocr_only: Only consider searchable PDF outputs, not text files
+        mode: Extraction mode. The vision modes also check which pages have
+            embedded text, so the estimate leaves out pages that won't be sent.
+        skip_searchable: Mark born-digital PDFs (at least NATIVE_PDF_MIN_SHARE
+            of the pages have a text layer) with has_text_layer, so they skip
+            OCR. Their text is still extracted.
+        existing: Optional set of file paths seen by find_pdfs(), used
+            instead of stat() to check whether outputs exist
+        force_ocr: The claude and gemini modes send every page, so their
+            text layers need no probing
+
+    Returns:
+        List of WorkItem, one per PDF in pdf_files
+    """
+    print("Analyzing PDFs for cost estimation...")
+
+    # Output checks are stats and small reads, so they overlap well on threads
+    with ThreadPoolExecutor(max_workers=IO_WORKERS) as executor:
+        decisions = list(executor.map(
+            lambda pdf_file: _check_outputs(pdf_file, output_format, overwrite, ocr_only, skip_existing, existing),
+            pdf_files
+        ))
+
+    # Count pages of everything that will be processed (probing for a text
+    # layer at the same time if asked to)
+    to_count = [d[0] for d in decisions if d[4]]
+    skips_native = mode == 'auto' or (mode in ('claude', 'gemini') and not force_ocr)
+    if (skips_native and not ocr_only) or skip_searchable:
+        counts = {}
+        for pdf_file, (pages, vision) in count_vision_pages(to_count).items():
+            born_digital = pages > 0 and pages - vision >= NATIVE_PDF_MIN_SHARE * pages
+            # Only auto mode and born-digital PDFs in the claude and gemini
+            # modes skip the pages with embedded text
+            if mode != 'auto' and not (born_digital and skips_native):
+                vision = pages
+            counts[pdf_file] = (pages, vision, skip_searchable and born_digital)
+    else:
+        counts = {pdf_file: (pages, pages, False) for pdf_file, pages in count_pages(to_count).items()}
+
+    work_items = []
+    for pdf_file, txt_file, output_pdf, final_pdf, needs_reprocess, had_error in decisions:
+        page_count, vision_pages, searchable = counts.get(pdf_file, (0, 0, False))
+        work_items.append(WorkItem(pdf_file, txt_file, output_pdf, final_pdf, page_count, vision_pages, needs_reprocess, had_error, searchable))
+    return work_items
+
+
+# Letter-size page in inches, used to estimate rendered image size
+_PAGE_INCHES = (8.5, 11)
+
+
+def _claude_image_tokens(dpi):
+    """Estimate the input tokens Claude charges for one page image rendered at dpi."""
+    width, height = (inches * dpi for inches in _PAGE_INCHES)
+    # Claude scales images down to at most 1568px on the long edge and ~1.15
+    # megapixels before tokenizing, at about 750 pixels per token
+    scale = min(1.0, 1568 / max(width, height))
+    pixels = min(width * height * scale * scale, 1_150_000)
+    return pixels / 750
+
+
+def cost_per_page(mode='claude', dpi=DEFAULT_DPI):
+    """
+    Estimate the API cost in dollars of extracting one page.
+
+    Claude Sonnet 4.5:
+      Input: $3 per million tokens, image tokens depend on dpi
+      (~1,500 tokens per letter page at 150 DPI)
+      Output: $15 per million tokens, ~750 tokens per page (extracted text)
+      Total: ~$0.016 per page at 150 DPI
+
+    Gemini 2.0 Flash:
+      Input: $0.075 per million tokens, ~2,000 tokens per page
+      Output: $0.30 per million tokens, ~750 tokens per page
+      Total: ~$0.0001 per page (rounded to 4 decimal places)
+
+    spaCy/local: Free (no API cost)
+    """
+    if mode == 'gemini':
+        return 0.0001
+    if mode in ['spacy', 'local']:
+        return 0.0
+    # claude (default) and auto
+    return _claude_image_tokens(dpi) * 3 / 1_000_000 + 750 * 15 / 1_000_000
+
+
+def estimate_cost(work_items, mode='claude', dpi=DEFAULT_DPI):
+    """
+    Estimate the cost of processing PDFs.
+
+    Args:
+        work_items: List of WorkItem from scan_workload()
+        mode: Extraction mode ('claude', 'gemini', 'auto', 'spacy', or 'local')
+        dpi: Resolution pages are rendered at for the vision APIs
 
     Returns:
         (total_pdfs, pdfs_to_process, pdfs_with_errors, total_pages, estimated_cost)
     """
-    total_pdfs = len(pdf_files)
-    pdfs_to_process = []
-    pdfs_with_errors = []
-    total_pages = 0
+    total_pdfs = len(work_items)
+    to_process = [item for item in work_items if item.needs_reprocess]
+    pdfs_with_errors = [item.pdf for item in to_process if item.had_error]
+    total_pages = sum(item.page_count for item in to_process)
+    vision_pages = sum(item.vision_pages for item in to_process)
 
-    print("Analyzing PDFs for cost estimation...")
+    # Auto mode pays Claude pricing, but only for pages without embedded text
+    estimated_cost = vision_pages * cost_per_page(mode, dpi)
 
-    for pdf_file in pdf_files:
-        # Check if already processed
-        txt_file = pdf_file.with_suffix('.txt')
-        should_process = False
+    return total_pdfs, len(to_process), pdfs_with_errors, total_pages, estimated_cost
 
-        if skip_existing and txt_file.exists():
-            # Check if the text file contains API errors
-            try:
-                with open(txt_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                if contains_api_error(content):
-                    # File has errors, need to reprocess
-                    should_process = True
-                    pdfs_with_errors.append(pdf_file)
-                else:
-                    # File is good, skip it
-                    continue
-            except Exception:
-                # Can't read file, better to reprocess
-                should_process = True
-                pdfs_with_errors.append(pdf_file)
+
+# Bounded buffers between pipeline stages. Keeps at most this many rasterized
+# PDFs in memory while the API stage catches up.
+PIPELINE_QUEUE_SIZE = 8
+
+# Sentinel pushed through the queues to shut down the next stage
+_DONE = None
+
+# Number of PDFs extracted concurrently by default
+DEFAULT_WORKERS = 4
+
+# Minimum seconds between page-progress lines written without progress bars
+PROGRESS_INTERVAL = 0.1
+
+
+def _init_cpu_worker():
+    """
+    Process pool initializer: leave Ctrl-C handling to the main process.
+
+    Also loads the spaCy model up front, so each worker pays for it once and
+    all workers load it in parallel. Failures (e.g. spacy not installed)
+    are left to the first real extraction or OCR call to report, since an
+    initializer that raises would break the whole pool.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        get_spacy_layout()
+    except Exception:
+        pass
+
+
+def _make_raster_pool(opts):
+    """
+    Create a process pool for rendering page images, or None if not useful.
+
+    See make_render_pool(). Not used with a single worker or when no page
+    images are sent to an API.
+    """
+    if opts['workers'] < 2 or opts['ocr_only'] or opts['mode'] not in ('claude', 'gemini'):
+        return None
+    return make_render_pool()
+
+
+def _make_cpu_pool(opts):
+    """
+    Create a process pool for spaCy extraction and OCR, or None if not useful.
+
+    Both are pure-Python CPU work that holds the GIL, so worker threads
+    would run them one at a time. Not used with a single worker or when the
+    run does neither.
+    """
+    local_extract = opts['mode'] in ('spacy', 'local') and not opts['ocr_only']
+    if opts['workers'] < 2 or not (local_extract or not opts['skip_ocr']):
+        return None
+    return ProcessPoolExecutor(
+        max_workers=opts['workers'],
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_cpu_worker
+    )
+
+
+def _run_cpu(opts, fn, *args, **kwargs):
+    """Call fn in opts['cpu_pool'] if there is one, else on the current thread, and return its result."""
+    if opts['cpu_pool'] is None:
+        return fn(*args, **kwargs)
+    return opts['cpu_pool'].submit(fn, *args, **kwargs).result()
+
+
+def _load_one(opts, i, item, events):
+    """
+    Look up the extraction cache for one PDF and rasterize it if needed.
+
+    Returns (cached, images, pdf_hash), or None if the PDF could not be
+    rasterized (an 'error' event has been posted). cached is True when the
+    text file was restored from the cache and extraction can be skipped.
+    images is None unless the extraction mode sends page images to a
+    vision API. Pages whose embedded text is used instead are not rendered
+    and are None in images.
+    """
+    pdf_file = item.pdf
+
+    # Reuse text extracted from an identical PDF on an earlier run
+    pdf_hash = None
+    if opts['use_cache'] and not opts['ocr_only']:
+        try:
+            pdf_hash = cached_pdf_sha256(pdf_file)
+        except OSError:
+            pass
+        cache_path = pdf_hash and text_cache_path(pdf_hash, opts['config_key'])
+        # load_cached_text() reports a missing entry, so no separate exists() probe
+        if cache_path and load_cached_text(cache_path, item.txt):
+            events.put(('cached', i, item.txt))
+            return True, None, pdf_hash
+
+    images = None
+    if not opts['ocr_only'] and opts['mode'] in ('claude', 'gemini'):
+        try:
+            # Decide which pages go to the vision API before rendering, so
+            # born-digital pages are never rasterized
+            vision_pages = vision_page_numbers(str(pdf_file), opts['mode'], opts['force_ocr'])
+            if vision_pages:
+                # Gemini takes the JPEG bytes as they are; Claude needs base64
+                images = pdf_to_images(str(pdf_file), pages=vision_pages, dpi=opts['dpi'], pool=opts['raster_pool'], as_bytes=opts['mode'] == 'gemini')
+        except Exception as e:
+            events.put(('error', i, e))
+            return None
+
+    return False, images, pdf_hash
+
+
+def _extract_one(opts, i, item, images, pdf_hash, events):
+    """
+    Extract text from one PDF and write its text file.
+
+    Returns True if the PDF should go on to the OCR step.
+    """
+    # Extract text (unless OCR-only mode)
+    if opts['ocr_only']:
+        return True
+
+    pdf_file, main_output_file = item.pdf, item.txt
+    events.put(('info', i, "→ Extracting text..."))
+
+    def progress(page, total):
+        events.put(('progress', i, (page, total)))
+
+    try:
+        if opts['mode'] in ('spacy', 'local'):
+            # No API client, limiter or callback to share, so this can run
+            # in the process pool
+            num_pages, page_timings, file_time = _run_cpu(
+                opts,
+                extract_pdf_text_with_mode,
+                str(pdf_file),
+                str(main_output_file),
+                mode=opts['mode'],
+                output_format=opts['output_format']
+            )
         else:
-            # File doesn't exist or skip_existing is False
-            should_process = True
+            num_pages, page_timings, file_time = extract_pdf_text_with_mode(
+                str(pdf_file),
+                str(main_output_file),
+                api_key=opts['api_key'],
+                progress_callback=progress,
+                mode=opts['mode'],
+                output_format=opts['output_format'],
+                images=images,
+                rate_limiter=opts['rate_limiter'],
+                batch_pages=opts['batch_pages'],
+                dpi=opts['dpi'],
+                client=opts['client'],
+                # Concurrency comes from extracting `workers` PDFs at once
+                max_workers=1,
+                page_cache=opts['use_cache'],
+                force_vision=opts['force_ocr']
+            )
+    except Exception as e:
+        events.put(('error', i, e))
+        return False
+
+    _finish_extract(opts, i, item, pdf_hash, num_pages, file_time, events)
+    return True
+
+
+def _finish_extract(opts, i, item, pdf_hash, num_pages, file_time, events):
+    """Cache a finished extraction and post its 'extracted' event."""
+    main_output_file = item.txt
+
+    # Check if file has warnings about failed pages
+    warning = None
+    try:
+        with open(main_output_file, 'r', encoding='utf-8') as f:
+            first_line = f.readline()
+        if first_line.startswith('⚠️  WARNING:'):
+            warning = first_line.strip()
+    except Exception:
+        # If we can't read the file, just report success
+        pass
 
-        if should_process:
-            pdfs_to_process.append(pdf_file)
+    # Only cache complete extractions
+    if pdf_hash and not warning:
+        store_cached_text(main_output_file, text_cache_path(pdf_hash, opts['config_key']))
 
-            # Count pages
-            try:
-                doc = fitz.open(str(pdf_file))
-                page_count = len(doc)
-                doc.close()
-                total_pages += page_count
-            except Exception:
-                # Assume average of 5 pages if we can't open it
-                total_pages += 5
-
-    # Cost calculation based on mode:
-    #
-    # Claude Sonnet 4.5:
-    #   Input: $3 per million tokens, ~2,000 tokens per page (2x resolution image)
-    #   Output: $15 per million tokens, ~750 tokens per page (extracted text)
-    #   Input cost: 2,000 × $3/1M = $0.006
-    #   Output cost: 750 × $15/1M = $0.01125
-    #   Total: ~$0.018 per page
-    #
-    # Gemini 2.0 Flash:
-    #   Input: $0.075 per million tokens, ~2,000 tokens per page
-    #   Output: $0.30 per million tokens, ~750 tokens per page
-    #   Input cost: 2,000 × $0.075/1M = $0.00015
-    #   Output cost: 750 × $0.30/1M = $0.000225
-    #   Total: ~$0.0001 per page (rounded to 4 decimal places)
-    #
-    # spaCy/local: Free (no API cost)
+    events.put(('extracted', i, (main_output_file, num_pages, file_time, warning)))
 
-    if mode == 'gemini':
-        cost_per_page = 0.0001
-    elif mode in ['spacy', 'local']:
-        cost_per_page = 0.0
-    else:  # claude (default)
-        cost_per_page = 0.018
 
-    estimated_cost = total_pages * cost_per_page
+async def _extract_one_async(opts, i, item, images, pdf_hash, events, client):
+    """
+    _extract_one() for the asyncio pipeline.
+
+    Vision API modes await their requests on the event loop with the async
+    client; spaCy and OCR-only fall back to _extract_one() on a worker thread.
+    """
+    if opts['ocr_only'] or opts['mode'] not in ('claude', 'gemini', 'auto'):
+        return await asyncio.to_thread(_extract_one, opts, i, item, images, pdf_hash, events)
+
+    events.put(('info', i, "→ Extracting text..."))
+
+    def progress(page, total):
+        events.put(('progress', i, (page, total)))
 
-    return total_pdfs, len(pdfs_to_process), pdfs_with_errors, total_pages, estimated_cost
+    try:
+        num_pages, page_timings, file_time = await extract_pdf_text_async(
+            str(item.pdf),
+            str(item.txt),
+            client,
+            progress_callback=progress,
+            mode=opts['mode'],
+            output_format=opts['output_format'],
+            images=images,
+            rate_limiter=opts['rate_limiter'],
+            batch_pages=opts['batch_pages'],
+            dpi=opts['dpi'],
+            page_cache=opts['use_cache'],
+            force_vision=opts['force_ocr']
+        )
+    except Exception as e:
+        events.put(('error', i, e))
+        return False
+
+    await asyncio.to_thread(_finish_extract, opts, i, item, pdf_hash, num_pages, file_time, events)
+    return True
+
+
+def _mark_done(opts, pdf_file):
+    """Record a finished PDF in the resume checkpoint, if one is in use."""
+    if opts['checkpoint'] is None:
+        return
+    try:
+        # After --overwrite this hashes the new searchable PDF, which is what
+        # the next run will find at this path
+        st = os.stat(pdf_file)
+        opts['checkpoint'].add(pdf_file, cached_pdf_sha256(pdf_file), st)
+    except OSError:
+        pass
+
+
+def _images_for_inject(opts, item, images):
+    """
+    Return the page images to hand on to the OCR step, or None.
+
+    Pages rendered for the vision API are reused for the searchable PDF so
+    it doesn't rasterize them a second time, unless they fall short of what
+    the injector would render: a lower JPEG quality, or a resolution below
+    PAGE_IMAGE_DPI. Oversized pages are capped at MAX_LONG_EDGE for the API,
+    so the resolution is checked per page and those pages are left as None
+    for the injector to render.
+    """
+    if opts['skip_ocr'] or images is None or opts['dpi'] < PAGE_IMAGE_DPI or JPEG_QUALITY < PAGE_IMAGE_JPEG_QUALITY:
+        return None
+    try:
+        sizes = pdf_page_sizes(str(item.pdf))
+    except Exception:
+        # The injector renders every page itself
+        return None
+    return [
+        image if render_dpi(width, height, opts['dpi']) >= PAGE_IMAGE_DPI else None
+        for image, (width, height) in zip(images, sizes)
+    ]
 
 
-def batch_process(directory, api_key, overwrite=False, skip_existing=True, auto_confirm=False, mode='claude', output_format='markdown', ocr_only=False, skip_ocr=False):
+def _inject_one(opts, i, item, events, in_flight, images=None):
+    """
+    Create the searchable PDF for one PDF and post its 'done' or 'error' event.
+
+    images are the pages already rendered by _load_one(), if any.
+    """
+    pdf_file, output_pdf, final_pdf = item.pdf, item.output_pdf, item.final_pdf
+    # Create searchable PDF using OCR (unless skip_ocr is set)
+    if opts['skip_ocr']:
+        _mark_done(opts, pdf_file)
+        events.put(('done', i, None))
+        return
+
+    # Born-digital PDFs already have a text layer: keep them as they are
+    if item.has_text_layer:
+        try:
+            copied = _keep_searchable(item, opts['overwrite'])
+        except OSError as e:
+            events.put(('error', i, e))
+            return
+        _mark_done(opts, pdf_file)
+        events.put(('done', i, f"✓ Already searchable, copied to {final_pdf.name}" if copied else "✓ Already searchable, no OCR needed"))
+        return
+
+    events.put(('info', i, "→ Creating searchable PDF with OCR..."))
+    in_flight.add(output_pdf)
+    try:
+        _run_cpu(opts, inject_text_to_pdf, str(pdf_file), str(final_pdf), fsync=opts['fsync'], page_images=images)
+    except Exception as e:
+        events.put(('error', i, e))
+        return
+    finally:
+        in_flight.discard(output_pdf)
+
+    if opts['overwrite']:
+        message = f"✓ Updated: {final_pdf.name}"
+    else:
+        message = f"✓ Created: {final_pdf.name}"
+    _mark_done(opts, pdf_file)
+    events.put(('done', i, message))
+
+
+def _load_stage(work, opts, load_q, inject_q, events, stop):
+    """
+    Pipeline stage 1: rasterize the pages of each PDF that needs work.
+
+    Pushes (index, item, images, pdf_hash) onto load_q. PDFs whose text
+    is already in the extraction cache go straight to inject_q.
+    """
+    try:
+        for i, item in enumerate(work, 1):
+            if stop.is_set():
+                break
+
+            events.put(('start', i, None))
+            loaded = _load_one(opts, i, item, events)
+            if loaded is None:
+                continue
+
+            cached, images, pdf_hash = loaded
+            if cached:
+                inject_q.put((i, item, None))
+            else:
+                load_q.put((i, item, images, pdf_hash))
+    finally:
+        load_q.put(_DONE)
+
+
+def _on_task_done(future, i, events, release=None):
+    """
+    Done callback of a pipeline task: free its slot and report unexpected errors.
+
+    Tasks post 'error' events for the failures they expect. Anything else
+    they raise is posted here, so the PDF still counts as failed instead of
+    dropping out of the summary.
+    """
+    if release:
+        release()
+    if not future.cancelled() and future.exception() is not None:
+        events.put(('error', i, future.exception()))
+
+
+def _extract_task(opts, i, item, images, pdf_hash, inject_q, events, stop):
+    """Run _extract_one() on a worker thread and hand successes to the inject stage."""
+    if stop.is_set():
+        return
+    if _extract_one(opts, i, item, images, pdf_hash, events):
+        inject_q.put((i, item, _images_for_inject(opts, item, images)))
+
+
+def _extract_stage(opts, load_q, inject_q, events, stop):
+    """
+    Pipeline stage 2: extract text from up to opts['workers'] PDFs at once.
+
+    Extraction is dominated by API round-trips, so a thread pool overlaps
+    the requests of several files. In spaCy mode each thread hands its PDF
+    to the process pool instead.
+    """
+    # Only pull the next PDF off load_q once a worker is free, so the
+    # bounded queue keeps applying backpressure to the load stage
+    slots = threading.BoundedSemaphore(opts['workers'])
+    try:
+        with ThreadPoolExecutor(max_workers=opts['workers']) as executor:
+            for i, item, images, pdf_hash in iter(load_q.get, _DONE):
+                if stop.is_set():
+                    continue
+                slots.acquire()
+                future = executor.submit(_extract_task, opts, i, item, images, pdf_hash, inject_q, events, stop)
+                future.add_done_callback(lambda future, i=i: _on_task_done(future, i, events, slots.release))
+                # Drop our reference so the worker owns the only copy
+                images = None
+    finally:
+        inject_q.put(_DONE)
+
+
+def _inject_stage(opts, inject_q, events, stop, in_flight):
+    """
+    Pipeline stage 3: create the searchable PDF with OCR.
+
+    Runs up to opts['ocr_workers'] PDFs at once. Pushes a 'done' event for
+    every PDF that made it through the pipeline, followed by the _DONE
+    sentinel once the stage shuts down.
+    """
+    try:
+        with ThreadPoolExecutor(max_workers=opts['ocr_workers']) as executor:
+            for i, item, images in iter(inject_q.get, _DONE):
+                if stop.is_set():
+                    continue
+                future = executor.submit(_inject_one, opts, i, item, events, in_flight, images)
+                future.add_done_callback(lambda future, i=i: _on_task_done(future, i, events))
+                images = None
+    finally:
+        events.put(_DONE)
+
+
+async def _process_one_async(opts, i, item, sem, inject_sem, events, stop, in_flight, client):
+    """Run one PDF through load, extract and inject, with blocking steps on worker threads."""
+    async with sem:
+        if stop.is_set():
+            return
+        events.put(('start', i, None))
+        loaded = await asyncio.to_thread(_load_one, opts, i, item, events)
+        if loaded is None or stop.is_set():
+            return
+
+        cached, images, pdf_hash = loaded
+        if not cached:
+            extracted = await _extract_one_async(opts, i, item, images, pdf_hash, events, client)
+            images = _images_for_inject(opts, item, images)
+            if not extracted:
+                return
+
+    # OCR is CPU-bound, so it gets its own limit, as in the threaded
+    # pipeline; the semaphore slot is already free for the next PDF's API calls
+    async with inject_sem:
+        if stop.is_set():
+            return
+        await asyncio.to_thread(_inject_one, opts, i, item, events, in_flight, images)
+
+
+async def _batch_process_async(work, opts, events, stop, in_flight):
+    """
+    asyncio alternative to the three pipeline threads.
+
+    Every PDF is a task; a semaphore keeps at most opts['workers'] of them
+    loading or extracting at once. Vision API requests are awaited on the
+    loop through an async client, so threads are only needed for
+    rasterizing, file I/O and OCR. Posts the same events as the threaded
+    pipeline, followed by the _DONE sentinel.
+    """
+    # Enough threads for every extraction slot plus the OCR steps
+    executor = ThreadPoolExecutor(max_workers=opts['workers'] + opts['ocr_workers'])
+    asyncio.get_running_loop().set_default_executor(executor)
+    sem = asyncio.Semaphore(opts['workers'])
+    inject_sem = asyncio.Semaphore(opts['ocr_workers'])
+
+    # Async clients are tied to the event loop, so create them here
+    client = None
+    if opts['mode'] in ('claude', 'auto') and not opts['ocr_only']:
+        client = make_claude_async_client(opts['api_key'])
+    elif opts['mode'] == 'gemini':
+        # The shared genai client exposes its async API as client.aio
+        client = opts['client']
+
+    try:
+        await asyncio.gather(*(
+            _process_one_async(opts, i, item, sem, inject_sem, events, stop, in_flight, client)
+            for i, item in enumerate(work, 1)
+        ))
+    finally:
+        if opts['mode'] in ('claude', 'auto') and client is not None:
+            await client.close()
+        events.put(_DONE)
+
+
+def _keep_searchable(item, overwrite):
+    """
+    Use a PDF that already has a text layer as its own searchable PDF, without OCR.
+
+    With --overwrite it is left untouched; otherwise it is copied to
+    *_searchable.pdf so every input still has a searchable output. Returns
+    True if a copy was made; raises OSError if copying fails.
+    """
+    # Don't copy our own earlier outputs to *_searchable_searchable.pdf
+    if overwrite or item.pdf.stem.endswith('_searchable') or item.final_pdf.exists():
+        return False
+    fast_copy(item.pdf, item.final_pdf)
+    shutil.copystat(item.pdf, item.final_pdf)
+    return True
+
+
+def _pass_through_searchable(items, overwrite):
+    """
+    Run _keep_searchable() over PDFs whose text output is already done.
+
+    Returns the number of PDFs copied.
+    """
+    copied = 0
+    for item in items:
+        try:
+            copied += _keep_searchable(item, overwrite)
+        except OSError as e:
+            print(f"  ✗ Error: {item.pdf.name}: {e}")
+    return copied
+
+
+def _progress_bars(total_files, total_pages):
+    """
+    Create tqdm progress bars for files and pages.
+
+    Returns (files_bar, pages_bar), or (None, None) when tqdm is not
+    installed or stdout is not a terminal. pages_bar is None if total_pages
+    is 0 (e.g. OCR-only runs, which report no page progress).
+    """
+    if not sys.stdout.isatty():
+        return None, None
+    try:
+        from tqdm import tqdm
+    except ImportError:
+        return None, None
+
+    files_bar = tqdm(total=total_files, desc='Files', unit='pdf', position=0)
+    pages_bar = tqdm(total=total_pages, desc='Pages', unit='page', position=1) if total_pages else None
+    return files_bar, pages_bar
+
+
+def batch_process(directory, api_key, overwrite=False, skip_existing=True, auto_confirm=False, mode='claude', output_format='markdown', ocr_only=False, skip_ocr=False, workers=DEFAULT_WORKERS, requests_per_min=None, tokens_per_min=None, use_cache=True, batch_pages=DEFAULT_BATCH_PAGES, dpi=DEFAULT_DPI, use_async=False, resume=True, reset_checkpoint=False, force_ocr=False, fsync=False):
     """
     Batch process all PDFs in a directory tree.
 
@@ -117,61 +1016,102 @@ def batch_process(directory, api_key, overwrite=False, skip_existing=True, auto_
         overwrite: If True, overwrite original PDFs. If False, create *_searchable.pdf
         skip_existing: If True, skip PDFs that already have text files
         auto_confirm: If True, skip confirmation prompt
-        mode: Extraction mode ('claude', 'gemini', or 'spacy')
+        mode: Extraction mode ('claude', 'gemini', 'auto', or 'spacy')
         output_format: Output format ('markdown' or 'plain')
         ocr_only: If True, only create searchable PDFs using OCR (skip text extraction)
         skip_ocr: If True, only do text extraction (skip creating searchable PDFs)
+        workers: Number of PDFs to extract concurrently
+        requests_per_min: Optional API request budget shared by all workers
+        tokens_per_min: Optional API token budget shared by all workers
+        use_cache: If True, reuse text extracted from byte-identical PDFs on
+            earlier runs (cached under ~/.cache/pdf-text-extractor)
+        batch_pages: Number of pages sent per vision API request
+        dpi: Resolution pages are rendered at for the vision APIs
+        use_async: If True, schedule PDFs as asyncio tasks instead of the
+            three pipeline threads, awaiting API requests on the event loop
+        resume: If True (and skip_existing), skip PDFs recorded as finished
+            in the checkpoint by an earlier run with the same settings
+        reset_checkpoint: If True, clear the checkpoint before starting
+        force_ocr: If True, OCR PDFs that already have a text layer and send
+            all their pages to the vision API (by default born-digital PDFs
+            keep their text layer instead of being OCR'd)
+        fsync: If True, fsync each searchable PDF and its directory after writing
     """
 
-    pdf_files = find_pdfs(directory)
+    existing = set()  # Every .pdf/.md/.txt path in the tree, from the same walk
+    pdf_files = find_pdfs(directory, seen=existing)
 
     if not pdf_files:
         print(f"No PDF files found in {directory}")
         return
 
-    # Estimate cost (only if not OCR-only mode)
-    if not ocr_only:
-        total_pdfs, pdfs_to_process, pdfs_with_errors, total_pages, estimated_cost = estimate_cost(pdf_files, skip_existing, mode)
-    else:
-        # In OCR-only mode, process all PDFs or skip based on searchable PDF existence
-        total_pdfs = len(pdf_files)
-        pdfs_to_process = 0
-        pdfs_with_errors = []
-        total_pages = 0
+    found_pdfs = len(pdf_files)
+    config_key = extraction_config_key(mode, output_format, batch_pages, dpi, force_ocr)
+
+    # Drop PDFs an interrupted earlier run already finished
+    checkpoint = None
+    resumed = 0
+    if resume or reset_checkpoint:
+        operation = 'ocr-only' if ocr_only else 'skip-ocr' if skip_ocr else 'full'
+        checkpoint = Checkpoint(f"{config_key}:{operation}:{'overwrite' if overwrite else 'new'}")
+        if reset_checkpoint:
+            checkpoint.reset()
+        if not resume:
+            checkpoint = None
+        elif skip_existing and len(checkpoint):
+            with ThreadPoolExecutor(max_workers=IO_WORKERS) as executor:
+                done = list(executor.map(lambda p: _resumed_from_checkpoint(checkpoint, p), pdf_files))
+            remaining = [p for p, is_done in zip(pdf_files, done) if not is_done]
+            resumed = len(pdf_files) - len(remaining)
+            pdf_files = remaining
+
+    # Decide what needs doing and estimate cost in one pass over the tree
+    skip_searchable = not force_ocr and not skip_ocr
+    work_items = scan_workload(pdf_files, skip_existing, output_format, overwrite, ocr_only, mode, skip_searchable, existing, force_ocr)
+    if checkpoint is not None and skip_existing:
+        _record_complete(checkpoint, [item for item in work_items if not item.needs_reprocess and not item.has_text_layer])
+    # Identical PDFs are processed once; the rest get copies of the outputs
+    work_items, duplicates = split_duplicates(work_items)
+    duplicate_count = sum(len(dups) for dups in duplicates.values())
+    total_pdfs, pdfs_to_process, pdfs_with_errors, total_pages, estimated_cost = estimate_cost(work_items, mode, dpi)
+    if ocr_only:
         estimated_cost = 0.0
-
-        for pdf_file in pdf_files:
-            output_pdf = pdf_file.with_stem(f"{pdf_file.stem}_searchable") if not overwrite else pdf_file
-
-            if skip_existing and output_pdf.exists() and output_pdf != pdf_file:
-                continue
-
-            pdfs_to_process += 1
-            # Count pages for progress tracking
-            try:
-                doc = fitz.open(str(pdf_file))
-                total_pages += len(doc)
-                doc.close()
-            except Exception:
-                total_pages += 5  # Assume 5 pages if can't open
+    work = [item for item in work_items if item.needs_reprocess]
+    searchable = [item for item in work_items if item.has_text_layer]
+    # Born-digital PDFs in the work list are handled by the inject stage
+    finished_searchable = [item for item in searchable if not item.needs_reprocess]
 
     # Show summary
     print()
     print("=" * 60)
     print("BATCH PROCESSING SUMMARY")
     print("=" * 60)
-    print(f"Total PDFs found:        {total_pdfs}")
-    print(f"Already processed:       {total_pdfs - pdfs_to_process}")
+    print(f"Total PDFs found:        {found_pdfs}")
+    print(f"Already processed:       {found_pdfs - pdfs_to_process - duplicate_count}")
+    if resumed:
+        print(f"  (from checkpoint:      {resumed})")
+    if searchable:
+        print(f"Already searchable:      {len(searchable)} (have a text layer, so no OCR; use --force-ocr to OCR them)")
     if pdfs_with_errors:
         print(f"With API errors:         {len(pdfs_with_errors)} (will be reprocessed)")
     print(f"To be processed:         {pdfs_to_process}")
+    if duplicate_count:
+        print(f"Duplicates:              {duplicate_count} (identical to a PDF above; outputs will be copied)")
     print(f"Total pages:             {total_pages}")
+    if mode == 'auto' and not ocr_only:
+        native_pages = sum(item.page_count - item.vision_pages for item in work)
+        print(f"With embedded text:      {native_pages} (no API call needed)")
     if not ocr_only:
         print(f"Estimated cost:          ${estimated_cost:.2f}")
     print()
     if not skip_ocr:
         print(f"Mode: {'OVERWRITE originals' if overwrite else 'Create new files (*_searchable.pdf)'}")
     print(f"Skip existing: {'Yes' if skip_existing else 'No'}")
+    print(f"Workers: {workers}")
+    if batch_pages > 1 and mode in ('claude', 'gemini', 'auto') and not ocr_only:
+        print(f"Pages per request: {batch_pages}")
+    if requests_per_min or tokens_per_min:
+        print(f"Rate limit: {requests_per_min or 'unlimited'} requests/min, {tokens_per_min or 'unlimited'} tokens/min")
     if ocr_only:
         print(f"Operation: OCR only (no text extraction)")
     elif skip_ocr:
@@ -194,6 +1134,8 @@ def batch_process(directory, api_key, overwrite=False, skip_existing=True, auto_
     print()
 
     if pdfs_to_process == 0:
+        if _pass_through_searchable(finished_searchable, overwrite):
+            print("Copied already-searchable PDFs to *_searchable.pdf")
         print("✓ All PDFs already processed! Use --no-skip to reprocess.")
         return
 
@@ -218,152 +1160,195 @@ def batch_process(directory, api_key, overwrite=False, skip_existing=True, auto_
             print(f"Auto-confirming: Processing {pdfs_to_process} PDFs (~${estimated_cost:.2f})")
         print()
 
+    copied = _pass_through_searchable(finished_searchable, overwrite)
+    if copied:
+        print(f"Copied {copied} already-searchable PDFs to *_searchable.pdf")
+        print()
+
     processed = 0
-    skipped = 0
+    skipped = found_pdfs - pdfs_to_process - duplicate_count
     errors = 0
+    cache_hits = 0
     total_pages_processed = 0
     total_processing_time = 0.0
-    file_timings = []  # Track (filename, pages, time) for each file
-
-    for i, pdf_file in enumerate(pdf_files, 1):
-        print(f"[{i}/{len(pdf_files)}] {pdf_file.relative_to(directory)}")
-
-        # Determine output paths based on format
-        if output_format == 'markdown':
-            main_output_file = pdf_file.with_suffix('.md')
-        else:
-            main_output_file = pdf_file.with_suffix('.txt')
+    slowest = fastest = None  # (seconds per page, filename) of the extremes so far
+
+    # Three-stage pipeline so disk, API and OCR work overlap across files:
+    #   load/rasterize -> extract (API) -> inject + write
+    opts = {
+        'api_key': api_key,
+        'mode': mode,
+        'output_format': output_format,
+        'overwrite': overwrite,
+        'ocr_only': ocr_only,
+        'skip_ocr': skip_ocr,
+        'workers': max(1, workers),
+        'rate_limiter': None,
+        'client': None,
+        'use_cache': use_cache,
+        'batch_pages': max(1, batch_pages),
+        'dpi': dpi,
+        'config_key': config_key,
+        'checkpoint': checkpoint,
+        'raster_pool': None,
+        'cpu_pool': None,
+        'fsync': fsync,
+        'force_ocr': force_ocr,
+        'ocr_workers': 1,
+    }
+    if requests_per_min or tokens_per_min:
+        opts['rate_limiter'] = TokenBucket(requests_per_min, tokens_per_min)
+    if mode in ('claude', 'auto') and not ocr_only and not use_async:
+        # One pooled client for every page of every PDF
+        opts['client'] = make_claude_client(api_key)
+    elif mode == 'gemini' and not ocr_only:
+        opts['client'] = make_gemini_client(api_key)
+    opts['raster_pool'] = _make_raster_pool(opts)
+    opts['cpu_pool'] = _make_cpu_pool(opts)
+    if opts['cpu_pool'] is not None:
+        # OCR runs in the process pool, so it can use every worker too
+        opts['ocr_workers'] = opts['workers']
+    load_q = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    inject_q = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    events = queue.Queue()
+    stop = threading.Event()
+    in_flight = set()  # Temp PDFs currently being written by the inject stage
+
+    if use_async:
+        # One thread runs the event loop; it posts the same events
+        stages = [
+            threading.Thread(target=asyncio.run, args=(_batch_process_async(work, opts, events, stop, in_flight),), daemon=True),
+        ]
+    else:
+        stages = [
+            threading.Thread(target=_load_stage, args=(work, opts, load_q, inject_q, events, stop), daemon=True),
+            threading.Thread(target=_extract_stage, args=(opts, load_q, inject_q, events, stop), daemon=True),
+            threading.Thread(target=_inject_stage, args=(opts, inject_q, events, stop, in_flight), daemon=True),
+        ]
+    for stage in stages:
+        stage.start()
+
+    # All output happens on this thread; the stages only report events.
+    # On a terminal with tqdm installed, progress is shown as two bars and
+    # status lines are written above them.
+    files_bar, pages_bar = _progress_bars(len(work), 0 if ocr_only else sum(item.page_count for item in work))
+    if files_bar:
+        from tqdm import tqdm
+        emit = tqdm.write
+    else:
+        emit = print
+    is_tty = sys.stdout.isatty()
+    pages_seen = {}  # Pages already counted on pages_bar, by PDF index
+    last_progress = 0.0  # When the last page-progress line was printed
 
-        if overwrite:
-            # Create temp file, then replace original
-            output_pdf = pdf_file.with_suffix('.pdf.tmp')
-            final_pdf = pdf_file
-        else:
-            # Create new file with _searchable suffix
-            output_pdf = pdf_file.with_stem(f"{pdf_file.stem}_searchable")
-            final_pdf = output_pdf
-
-        # Check if already processed
-        if not ocr_only:
-            # In normal mode, check if text extraction file exists
-            if skip_existing and main_output_file.exists():
-                # Check if the file contains API errors
-                try:
-                    with open(main_output_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    if contains_api_error(content):
-                        # File has errors, reprocess it
-                        print(f"  ⚠ Reprocessing (API error detected in existing file)")
-                    else:
-                        # File is good, skip it
-                        print(f"  ⊙ Skipping (output file exists)")
-                        skipped += 1
-                        continue
-                except Exception:
-                    # Can't read file, better to reprocess
-                    print(f"  ⚠ Reprocessing (cannot read existing file)")
-
-        # Check if searchable PDF already exists
-        if skip_existing and final_pdf.exists() and final_pdf != pdf_file:
-            print(f"  ⊙ Skipping (searchable PDF exists)")
-            skipped += 1
-            continue
+    def advance_pages(i, page):
+        if pages_bar and page > pages_seen.get(i, 0):
+            pages_bar.update(page - pages_seen.get(i, 0))
+            pages_seen[i] = page
 
-        try:
-            # Extract text (unless OCR-only mode)
-            if not ocr_only:
-                print(f"  → Extracting text...")
-
-                def progress(page, total):
-                    print(f"    Page {page}/{total}", end='\r', flush=True)
-
-                num_pages, page_timings, file_time = extract_pdf_text_with_mode(
-                    str(pdf_file),
-                    str(main_output_file),
-                    api_key=api_key,
-                    progress_callback=progress,
-                    mode=mode,
-                    output_format=output_format
-                )
+    try:
+        for event in iter(events.get, _DONE):
+            kind, i, payload = event
+            pdf_file = work[i - 1].pdf
+
+            if kind == 'start':
+                emit(f"[{i}/{len(work)}] {pdf_file.relative_to(directory)}")
+            elif kind == 'info':
+                emit(f"  {pdf_file.name}: {payload}")
+            elif kind == 'progress':
+                page, total = payload
+                if files_bar:
+                    advance_pages(i, page)
+                elif is_tty and time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                    # Without progress bars, only rewrite the line on a terminal,
+                    # and at most every PROGRESS_INTERVAL: with several workers
+                    # the updates would otherwise cost a write per page
+                    last_progress = time.monotonic()
+                    print(f"    {pdf_file.name}: page {page}/{total}", end='\r', flush=True)
+            elif kind == 'extracted':
+                main_output_file, num_pages, file_time, warning = payload
                 total_pages_processed += num_pages
                 total_processing_time += file_time
-                file_timings.append((pdf_file.name, num_pages, file_time))
-
-                # Check if file has warnings about failed pages
-                try:
-                    with open(main_output_file, 'r', encoding='utf-8') as f:
-                        first_line = f.readline()
-                        if first_line.startswith('⚠️  WARNING:'):
-                            print(f"  ⚠ Text extracted with warnings: {main_output_file.name} ({file_time:.1f}s, {num_pages} pages)          ")
-                            print(f"    {first_line.strip()}")
-                        else:
-                            print(f"  ✓ Text extracted: {main_output_file.name} ({file_time:.1f}s, {num_pages} pages)          ")
-                except Exception:
-                    # If we can't read the file, just show success message
-                    print(f"  ✓ Text extracted: {main_output_file.name} ({file_time:.1f}s, {num_pages} pages)          ")
-
-            # Create searchable PDF using OCR (unless skip_ocr is set)
-            if not skip_ocr:
-                print(f"  → Creating searchable PDF with OCR...")
-                inject_text_to_pdf(str(pdf_file), str(output_pdf))
-
-                # If overwriting, replace original
-                if overwrite:
-                    os.replace(str(output_pdf), str(final_pdf))
-                    print(f"  ✓ Updated: {final_pdf.name}")
+                if num_pages > 0:
+                    rate = (file_time / num_pages, pdf_file.name)
+                    if slowest is None or rate[0] > slowest[0]:
+                        slowest = rate
+                    if fastest is None or rate[0] < fastest[0]:
+                        fastest = rate
+                advance_pages(i, num_pages)
+                if warning:
+                    emit(f"  ⚠ Text extracted with warnings: {main_output_file.name} ({file_time:.1f}s, {num_pages} pages)          ")
+                    emit(f"    {warning}")
                 else:
-                    print(f"  ✓ Created: {final_pdf.name}")
-
-            processed += 1
-
-        except KeyboardInterrupt:
-            print(f"\n\n⚠ Interrupted by user")
-            # Clean up temp file if it exists
-            if output_pdf.exists() and output_pdf != final_pdf:
-                output_pdf.unlink()
-            break
-
-        except Exception as e:
-            print(f"  ✗ Error: {e}")
-            errors += 1
-            # Clean up temp file if it exists
-            if output_pdf.exists() and output_pdf != final_pdf:
-                output_pdf.unlink()
-            continue
+                    emit(f"  ✓ Text extracted: {main_output_file.name} ({file_time:.1f}s, {num_pages} pages)          ")
+            elif kind == 'cached':
+                emit(f"  ✓ Text reused from cache: {payload.name}")
+                advance_pages(i, work[i - 1].page_count)
+                cache_hits += 1
+            elif kind == 'error':
+                emit(f"  ✗ Error: {pdf_file.name}: {payload}")
+                errors += 1
+                if pdf_file in duplicates:
+                    emit(f"    {len(duplicates[pdf_file])} identical PDFs were not processed")
+                    errors += len(duplicates[pdf_file])
+                if files_bar:
+                    files_bar.update()
+            elif kind == 'done':
+                if payload:
+                    emit(f"  {payload}")
+                processed += 1
+                if pdf_file in duplicates:
+                    copied, failures = _copy_to_duplicates(opts, work[i - 1], duplicates[pdf_file])
+                    if copied:
+                        emit(f"  ✓ Copied outputs to {copied} identical PDFs")
+                    for dup, e in failures:
+                        emit(f"  ✗ Error: {dup.pdf.name}: {e}")
+                    processed += copied
+                    errors += len(failures)
+                if files_bar:
+                    files_bar.update()
 
-        print()
+    except KeyboardInterrupt:
+        print(f"\n\n⚠ Interrupted by user")
+        stop.set()
+        # Clean up temp files still being written
+        for output_pdf in list(in_flight):
+            if output_pdf.suffix == '.tmp':
+                output_pdf.unlink(missing_ok=True)
+    finally:
+        for bar in (pages_bar, files_bar):
+            if bar:
+                bar.close()
+        if opts['raster_pool'] is not None:
+            if stop.is_set():
+                opts['raster_pool'].terminate()
+            else:
+                opts['raster_pool'].close()
+        if opts['cpu_pool'] is not None:
+            opts['cpu_pool'].shutdown(wait=not stop.is_set(), cancel_futures=stop.is_set())
 
+    print()
     # Summary
     print("=" * 60)
     print(f"Batch processing complete!")
     print(f"  Processed: {processed}")
     print(f"  Skipped:   {skipped}")
     print(f"  Errors:    {errors}")
-    print(f"  Total:     {len(pdf_files)}")
+    if cache_hits:
+        print(f"  Cached:    {cache_hits} (text reused from earlier runs)")
+    print(f"  Total:     {found_pdfs}")
     if total_pages_processed > 0:
         print(f"\n  Total pages processed: {total_pages_processed}")
         print(f"  Total processing time: {total_processing_time:.1f}s ({total_processing_time / 60:.1f} min)")
         avg_per_page = total_processing_time / total_pages_processed
         print(f"  Average time per page: {avg_per_page:.1f}s")
-        if file_timings:
-            # Show slowest file
-            slowest_file = max(file_timings, key=lambda x: x[2] / x[1] if x[1] > 0 else 0)
-            fastest_file = min(file_timings, key=lambda x: x[2] / x[1] if x[1] > 0 else float('inf'))
-            if slowest_file[1] > 0:
-                print(f"  Slowest file: {slowest_file[0]} ({slowest_file[2] / slowest_file[1]:.1f}s/page)")
-            if fastest_file[1] > 0:
-                print(f"  Fastest file: {fastest_file[0]} ({fastest_file[2] / fastest_file[1]:.1f}s/page)")
-
-
-def main():
-    """Main CLI entry point for pdf-batch command."""
+        if slowest:
+            print(f"  Slowest file: {slowest[1]} ({slowest[0]:.1f}s/page)")
+            print(f"  Fastest file: {fastest[1]} ({fastest[0]:.1f}s/page)")
 
-    import argparse
 
-    parser = argparse.ArgumentParser(
-        description='Batch process PDFs with vision-based text extraction',
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog='''
+# Examples shown by pdf-batch --help
+_EPILOG = '''
 Examples:
   # Process all PDFs with markdown output using Claude (default)
   # Creates .md files for readability + searchable PDFs with OCR
@@ -373,6 +1358,9 @@ Examples:
   export GOOGLE_API_KEY='your-key-here'
   pdf-batch --mode=gemini /path/to/pdfs
 
+  # Use embedded text where the PDF has it, Claude only for scanned pages
+  pdf-batch --mode=auto /path/to/pdfs
+
   # Use plain text format (faster AI extraction, no markdown)
   pdf-batch --format=plain /path/to/pdfs
 
@@ -385,6 +1373,21 @@ Examples:
   # Skip confirmation prompt (auto-confirm)
   pdf-batch --yes /path/to/pdfs
 
+  # Extract 8 PDFs at a time (watch your API rate limits)
+  pdf-batch --workers=8 /path/to/pdfs
+
+  # Stay under your API tier's rate limits
+  pdf-batch --workers=8 --rpm=50 --tpm=40000 /path/to/pdfs
+
+  # Send 8 pages per API request, or 1 to send every page on its own
+  pdf-batch --batch-pages=8 /path/to/pdfs
+
+  # Drive API requests from one asyncio event loop instead of worker threads
+  pdf-batch --async --workers=16 /path/to/pdfs
+
+  # Start over, ignoring PDFs finished by an interrupted run
+  pdf-batch --reset-checkpoint /path/to/pdfs
+
   # Use local mode (no API key needed, spaCy only)
   pdf-batch --mode=spacy /path/to/pdfs
 
@@ -397,14 +1400,32 @@ Examples:
   pdf-batch --skip-ocr /path/to/pdfs
 
 Environment Variables:
-  ANTHROPIC_API_KEY    Required for mode=claude. Your Anthropic API key.
+  ANTHROPIC_API_KEY    Required for mode=claude and mode=auto. Your Anthropic API key.
   GOOGLE_API_KEY       Required for mode=gemini. Your Google API key.
 
 API keys can also be loaded from a .env file in the current directory.
 
 Note: Searchable PDFs are created using spaCy Layout OCR for accurate text
 positioning. The markdown/text files are separate outputs for readability.
-        '''
+'''
+
+
+def main():
+    """Main CLI entry point for pdf-batch command."""
+
+    # Without arguments, show the examples without building the parser
+    if len(sys.argv) == 1:
+        print("usage: pdf-batch [options] directory")
+        print("Run 'pdf-batch --help' for all options.")
+        print(_EPILOG)
+        sys.exit(2)
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Batch process PDFs with vision-based text extraction',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=_EPILOG
     )
 
     parser.add_argument(
@@ -431,9 +1452,9 @@ positioning. The markdown/text files are separate outputs for readability.
 
     parser.add_argument(
         '--mode',
-        choices=['claude', 'gemini', 'spacy', 'local'],
+        choices=['claude', 'gemini', 'auto', 'spacy', 'local'],
         default='claude',
-        help='Extraction mode: "claude" (default) uses Anthropic, "gemini" uses Google, "spacy" uses local layout/OCR'
+        help='Extraction mode: "claude" (default) uses Anthropic, "gemini" uses Google, "auto" uses embedded text where present and Claude for scanned pages, "spacy" uses local layout/OCR'
     )
 
     parser.add_argument(
@@ -449,6 +1470,76 @@ positioning. The markdown/text files are separate outputs for readability.
         help='Skip confirmation prompt (auto-confirm)'
     )
 
+    parser.add_argument(
+        '--workers', '-j',
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f'Number of PDFs to extract and OCR concurrently (default: {DEFAULT_WORKERS})'
+    )
+
+    parser.add_argument(
+        '--rpm',
+        type=int,
+        help='Maximum API requests per minute across all workers (default: unlimited)'
+    )
+
+    parser.add_argument(
+        '--tpm',
+        type=int,
+        help='Maximum estimated API tokens per minute across all workers (default: unlimited)'
+    )
+
+    parser.add_argument(
+        '--batch-pages',
+        type=int,
+        default=DEFAULT_BATCH_PAGES,
+        help=f'Pages sent per Claude or Gemini request (default: {DEFAULT_BATCH_PAGES}). Larger batches cut per-request overhead; failed batches are retried page by page.'
+    )
+
+    parser.add_argument(
+        '--dpi',
+        type=int,
+        default=DEFAULT_DPI,
+        help=f'Resolution of page images sent to the vision API (default: {DEFAULT_DPI}). Raise for small print in poor scans.'
+    )
+
+    parser.add_argument(
+        '--async',
+        dest='use_async',
+        action='store_true',
+        help='Await API requests on one asyncio event loop instead of a thread per worker; cheaper at high --workers'
+    )
+
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Always call the extraction API, even for PDFs extracted on an earlier run'
+    )
+
+    parser.add_argument(
+        '--force-ocr',
+        action='store_true',
+        help='Also OCR PDFs that already have a text layer (by default they are kept as their own searchable PDF)'
+    )
+
+    parser.add_argument(
+        '--no-resume',
+        action='store_true',
+        help='Ignore the checkpoint of PDFs finished by earlier (interrupted) runs'
+    )
+
+    parser.add_argument(
+        '--reset-checkpoint',
+        action='store_true',
+        help='Clear the checkpoint of finished PDFs before starting'
+    )
+
+    parser.add_argument(
+        '--fsync',
+        action='store_true',
+        help='Flush each searchable PDF to disk before moving on (slower, but safe against power loss)'
+    )
+
     parser.add_argument(
         '--ocr-only',
         action='store_true',
@@ -463,6 +1554,10 @@ positioning. The markdown/text files are separate outputs for readability.
 
     args = parser.parse_args()
 
+    # Load environment variables from .env file, once the arguments are valid
+    from dotenv import load_dotenv
+    load_dotenv()
+
     # Validate mutually exclusive flags
     if args.ocr_only and args.skip_ocr:
         print("Error: --ocr-only and --skip-ocr are mutually exclusive", file=sys.stderr)
@@ -476,8 +1571,8 @@ positioning. The markdown/text files are separate outputs for readability.
             api_key = args.api_key or os.environ.get('ANTHROPIC_API_KEY')
 
         # Require API key for AI modes
-        if args.mode == 'claude' and not api_key:
-            print("Error: ANTHROPIC_API_KEY environment variable not set (required for mode=claude)", file=sys.stderr)
+        if args.mode in ('claude', 'auto') and not api_key:
+            print(f"Error: ANTHROPIC_API_KEY environment variable not set (required for mode={args.mode})", file=sys.stderr)
             print("Set it with: export ANTHROPIC_API_KEY='your-key-here'", file=sys.stderr)
             print("Or pass with: --api-key YOUR_KEY", file=sys.stderr)
             sys.exit(1)
@@ -517,7 +1612,18 @@ positioning. The markdown/text files are separate outputs for readability.
             mode=args.mode,
             output_format=args.format,
             ocr_only=args.ocr_only,
-            skip_ocr=args.skip_ocr
+            skip_ocr=args.skip_ocr,
+            workers=args.workers,
+            requests_per_min=args.rpm,
+            tokens_per_min=args.tpm,
+            use_cache=not args.no_cache,
+            batch_pages=args.batch_pages,
+            dpi=args.dpi,
+            resume=not args.no_resume,
+            reset_checkpoint=args.reset_checkpoint,
+            force_ocr=args.force_ocr,
+            fsync=args.fsync,
+            use_async=args.use_async
         )
     except KeyboardInterrupt:
         print("\n\nInterrupted by user")
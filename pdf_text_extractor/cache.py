@@ -0,0 +1,339 @@
+"""
+On-disk caches that persist between runs.
+
+Everything lives under ~/.cache/pdf-text-extractor (or $XDG_CACHE_HOME).
+Cache failures are never fatal: a broken or unwritable cache only costs
+the work it would have saved.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from .utils import fast_copy, write_text
+
+# Read size used when hashing PDFs
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def cache_dir():
+    """Return the root cache directory, honouring $XDG_CACHE_HOME."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(base) / 'pdf-text-extractor'
+
+
+def pdf_sha256(path):
+    """Return the hex SHA-256 of a file's bytes, streamed in 1 MiB chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_cache_path(pdf_hash, config_key):
+    """
+    Return where extracted text for a PDF is cached.
+
+    Args:
+        pdf_hash: pdf_sha256() of the source PDF
+        config_key: extraction_config_key() for the mode/model/prompt used
+    """
+    return cache_dir() / 'text' / f"{pdf_hash}-{config_key}.txt"
+
+
+def load_cached_text(cache_path, output_path):
+    """
+    Copy a cached extraction to output_path.
+
+    Returns True on a cache hit, False if there is no usable entry.
+    """
+    try:
+        fast_copy(cache_path, output_path)
+        return True
+    except OSError:
+        return False
+
+
+def store_cached_text(output_path, cache_path):
+    """
+    Save a finished extraction into the cache.
+
+    The entry is copied rather than hardlinked: the extractor rewrites
+    outputs in place, which would silently change a linked cache entry.
+    """
+    tmp_path = None
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent, suffix='.tmp')
+        os.close(fd)
+        fast_copy(output_path, tmp_path)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def page_cache_path(image, config_key):
+    """
+    Return where the extracted text of one page image is cached.
+
+    Args:
+        image: The page image sent to the vision API, base64-encoded or as
+            raw bytes
+        config_key: extraction_config_key() for the provider and prompt used
+    """
+    if isinstance(image, str):
+        image = image.encode('ascii')
+    digest = hashlib.sha256(image).hexdigest()
+    return cache_dir() / 'pages' / f"{digest}-{config_key}.txt"
+
+
+def load_page_text(cache_path):
+    """Return the cached text of a page, or None if there is no usable entry."""
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except (OSError, ValueError):
+        return None
+
+
+def store_page_text(cache_path, text):
+    """Save the extracted text of one page into the cache."""
+    tmp_path = None
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent, suffix='.tmp')
+        os.close(fd)
+        write_text(tmp_path, text)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+class StatCache:
+    """
+    Small JSON cache of per-file results, keyed by absolute path.
+
+    Each entry remembers the file's mtime_ns and size when it was stored and
+    is ignored once either changes, so lookups cost one stat() instead of
+    re-reading the file. Entries are kept in memory and written back by
+    save(), which is registered to run at interpreter exit.
+    """
+
+    def __init__(self, name):
+        self.path = cache_dir() / f"{name}.json"
+        self._entries = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        atexit.register(self.save)
+
+    def _load(self):
+        """Read the cache file on first use. Caller holds the lock."""
+        if self._entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def get(self, path, st):
+        """Return the value stored for path if it still matches os.stat() result st, else None."""
+        with self._lock:
+            entry = self._load().get(os.path.abspath(path))
+        if entry and entry['mtime_ns'] == st.st_mtime_ns and entry['size'] == st.st_size:
+            return entry['value']
+        return None
+
+    def put(self, path, st, value):
+        """Store a JSON-serializable value for path as of os.stat() result st."""
+        with self._lock:
+            self._load()[os.path.abspath(path)] = {'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'value': value}
+            self._dirty = True
+
+    def save(self):
+        """Write the cache back to disk if anything changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_path = None
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self._entries, f)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except OSError:
+                if tmp_path and os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+
+
+# Verdicts of contains_api_error() for existing output files
+error_scan_cache = StatCache('error_scan')
+
+
+# SHA-256 of PDFs, so unchanged files are not re-hashed on every run
+pdf_hash_cache = StatCache('pdf_hash')
+
+
+# Page counts and text-layer probes of PDFs, as a dict per file, so cost
+# estimates for an unchanged tree don't reopen every PDF
+pdf_info_cache = StatCache('pdf_info')
+
+
+def cached_pdf_info(path, key, probe):
+    """
+    Return pdf_info_cache[path][key], calling probe(path) to fill it in on a miss.
+
+    Exceptions from probe() propagate and nothing is stored, so failures
+    are retried on the next run. Values come back as JSON types (tuples
+    become lists).
+    """
+    st = os.stat(path)
+    info = pdf_info_cache.get(path, st) or {}
+    if key not in info:
+        info = dict(info)
+        info[key] = probe(path)
+        pdf_info_cache.put(path, st, info)
+    return info[key]
+
+
+def has_cached_pdf_info(path, key):
+    """Return True if cached_pdf_info(path, key, ...) would be answered without calling its probe."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return key in (pdf_info_cache.get(path, st) or {})
+
+
+def cached_pdf_sha256(path):
+    """pdf_sha256() that reuses the digest from an earlier run while the file's mtime and size are unchanged."""
+    st = os.stat(path)
+    digest = pdf_hash_cache.get(path, st)
+    if digest is None:
+        digest = pdf_sha256(path)
+        pdf_hash_cache.put(path, st, digest)
+    return digest
+
+
+class Checkpoint:
+    """
+    Append-only record of the PDFs a batch has finished, for resuming.
+
+    Each finished PDF is one JSON line {"path", "sha256", "mtime_ns",
+    "size", "config", "done_at"} in state.jsonl. A PDF counts as done only
+    for the same absolute path, file contents and run configuration, so
+    edited files and runs with different settings are processed again.
+    Contents are compared by mtime and size first, so unchanged files are
+    recognized with one stat; the hash is the fallback for files that were
+    touched or copied back in place. Lines are flushed as they are written
+    and fsynced every FSYNC_EVERY entries.
+    """
+
+    FSYNC_EVERY = 32
+
+    def __init__(self, config, path=None):
+        self.config = config
+        self.path = Path(path) if path else cache_dir() / 'state.jsonl'
+        self._done = set()
+        self._paths = set()
+        self._stats = {}  # path -> (mtime_ns, size) when it was recorded
+        self._file = None
+        self._unsynced = 0
+        self._lock = threading.Lock()
+        self._load()
+        atexit.register(self.close)
+
+    def _load(self):
+        """Read the entries recorded for this configuration."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Last line of an interrupted write
+                        continue
+                    if entry.get('config') == self.config:
+                        self._done.add((entry['path'], entry['sha256']))
+                        self._paths.add(entry['path'])
+                        if 'mtime_ns' in entry:
+                            self._stats[entry['path']] = (entry['mtime_ns'], entry['size'])
+        except OSError:
+            pass
+
+    def __len__(self):
+        return len(self._done)
+
+    def knows(self, path):
+        """Return True if any version of path was recorded, i.e. is_done() might need its hash."""
+        return os.path.abspath(path) in self._paths
+
+    def is_done(self, path, sha=None, st=None):
+        """
+        Return True if path was finished by an earlier run.
+
+        Matches on the os.stat() result st when given, else on contents sha.
+        """
+        path = os.path.abspath(path)
+        if st is not None and self._stats.get(path) == (st.st_mtime_ns, st.st_size):
+            return True
+        return sha is not None and (path, sha) in self._done
+
+    def add(self, path, sha, st=None):
+        """Record that path with contents sha (and os.stat() result st) has been fully processed."""
+        entry = {'path': os.path.abspath(path), 'sha256': sha, 'config': self.config, 'done_at': time.time()}
+        if st is not None:
+            entry['mtime_ns'] = st.st_mtime_ns
+            entry['size'] = st.st_size
+        with self._lock:
+            try:
+                if self._file is None:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    self._file = open(self.path, 'a', encoding='utf-8')
+                self._file.write(json.dumps(entry) + '\n')
+                self._file.flush()
+                self._unsynced += 1
+                if self._unsynced >= self.FSYNC_EVERY:
+                    os.fsync(self._file.fileno())
+                    self._unsynced = 0
+            except OSError:
+                return
+            self._done.add((entry['path'], sha))
+            self._paths.add(entry['path'])
+            if st is not None:
+                self._stats[entry['path']] = (st.st_mtime_ns, st.st_size)
+
+    def reset(self):
+        """Forget every recorded PDF, for all configurations."""
+        with self._lock:
+            self._done.clear()
+            self._paths.clear()
+            self._stats.clear()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        """Flush outstanding entries to disk."""
+        with self._lock:
+            if self._file is not None:
+                try:
+                    os.fsync(self._file.fileno())
+                except OSError:
+                    pass
+                self._file.close()
+                self._file = None
@@ -4,11 +4,7 @@ Command-line interface for PDF text extraction.
 
 import sys
 import os
-from dotenv import load_dotenv
-from .extractor import extract_pdf_text_with_mode
-
-# Load environment variables from .env file
-load_dotenv()
+from .extractor import extract_pdf_text_with_mode, make_render_pool, pdf_page_count, PARALLEL_RENDER_MIN_PAGES
 
 
 def main():
@@ -20,7 +16,7 @@ def main():
         print("Usage: pdf-extract <input.pdf> <output.md> [api_key] [options]")
         print()
         print("Options:")
-        print("  --mode=claude|gemini|spacy   Extraction mode (default: claude)")
+        print("  --mode=claude|gemini|auto|spacy   Extraction mode (default: claude)")
         print("  --format=markdown|plain      Output format (default: markdown)")
         print()
         print("Extracts text from scanned PDFs using AI vision or local layout/OCR.")
@@ -40,6 +36,7 @@ def main():
         print("  # Other options")
         print("  pdf-extract scan.pdf output.txt --format=plain")
         print("  pdf-extract scan.pdf output.txt --mode=spacy")
+        print("  pdf-extract doc.pdf output.md --mode=auto   # Claude only for pages without embedded text")
         print()
         print("Note: To create searchable PDFs, use pdf-inject with spaCy OCR:")
         print("  pdf-inject scan.pdf searchable.pdf")
@@ -51,6 +48,10 @@ def main():
         print("  [text from page 2]")
         sys.exit(1)
 
+    # Load environment variables from .env file (not needed just to print usage)
+    from dotenv import load_dotenv
+    load_dotenv()
+
     input_pdf = sys.argv[1]
     output_txt = sys.argv[2]
     # Parse optional args: api_key, --mode, --format
@@ -97,8 +98,8 @@ def main():
         sys.exit(1)
 
     # Require API key when using AI modes
-    if mode == 'claude' and not api_key:
-        print("Error: ANTHROPIC_API_KEY environment variable not set (required for mode=claude)", file=sys.stderr)
+    if mode in ('claude', 'auto') and not api_key:
+        print(f"Error: ANTHROPIC_API_KEY environment variable not set (required for mode={mode})", file=sys.stderr)
         print("Set it with: export ANTHROPIC_API_KEY='your-key-here'", file=sys.stderr)
         print("Or pass as 3rd argument: pdf-extract input.pdf output.txt YOUR_API_KEY", file=sys.stderr)
         sys.exit(1)
@@ -113,14 +114,21 @@ def main():
     def progress(page, total):
         print(f"  Processing page {page}/{total}...", flush=True)
 
+    render_pool = None
     try:
+        # Render long scans on several cores (make_render_pool() uses half
+        # of them); page images are only needed by the vision modes
+        if mode in ('claude', 'gemini') and (os.cpu_count() or 1) >= 4 and pdf_page_count(input_pdf) >= PARALLEL_RENDER_MIN_PAGES:
+            render_pool = make_render_pool()
+
         total_pages, page_timings, total_time = extract_pdf_text_with_mode(
             input_pdf,
             output_txt,
             api_key=api_key,
             progress_callback=progress,
             mode=mode,
-            output_format=output_format
+            output_format=output_format,
+            render_pool=render_pool
         )
         print(f"\n✓ Text extracted successfully: {output_txt}")
         print(f"  Total pages: {total_pages}")
@@ -137,6 +145,9 @@ def main():
     except Exception as e:
         print(f"\n✗ Error: {e}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        if render_pool is not None:
+            render_pool.terminate()
 
 
 if __name__ == '__main__':
@@ -2,78 +2,71 @@
 Core text extraction functionality using vision AI (Claude or Gemini).
 """
 
-import base64
-from anthropic import Anthropic
-import fitz  # PyMuPDF
+import asyncio
+import functools
+import hashlib
 import sys
 import re
 import os
+import queue
+import shutil
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from .cache import page_cache_path, load_page_text, store_page_text
+from .ratelimit import EST_TOKENS_PER_PAGE
+from .utils import write_text, b64encode_str, b64decode, get_spacy_layout, FITZ_LOCK
+
+__all__ = [
+    "CLAUDE_MODEL", "GEMINI_MODEL", "DEFAULT_DPI", "DEFAULT_BATCH_PAGES", "DEFAULT_PAGE_WORKERS",
+    "PARALLEL_RENDER_MIN_PAGES", "ASYNC_REQUESTS_PER_PDF",
+    "make_claude_client", "make_claude_async_client", "make_gemini_client", "shared_client", "make_render_pool",
+    "get_prompt", "extraction_config_key", "contains_api_error", "is_fatal_api_error",
+    "native_page_texts", "vision_page_numbers", "has_text_layer", "render_page", "render_pages",
+    "pdf_to_images", "pdf_page_count", "pdf_page_sizes", "render_dpi", "iter_pdf_images",
+    "extract_text_from_page", "extract_text_from_pages",
+    "extract_text_from_page_gemini", "extract_text_from_pages_gemini",
+    "extract_text_from_page_async", "extract_text_from_pages_async",
+    "extract_pdf_text", "extract_pdf_text_with_mode", "iter_pdf_text_with_mode", "extract_pdf_text_async",
+]
+
+
+# Vision models used by the AI modes
+CLAUDE_MODEL = "claude-sonnet-4-5-20250929"
+GEMINI_MODEL = "gemini-2.5-flash-image"
+
+# Page images for the vision APIs are rendered at DEFAULT_DPI and sent as
+# JPEG, which is several times smaller than PNG with no visible loss for text
+DEFAULT_DPI = 150
+JPEG_QUALITY = 80
+# Longest side of a rendered page in pixels. Only oversized pages (posters,
+# drawings, A3 and up) reach it at DEFAULT_DPI; the vision models would
+# downsample anything larger anyway.
+MAX_LONG_EDGE = 2000
+IMAGE_MEDIA_TYPE = "image/jpeg"
+
+_CLAUDE_MARKDOWN_PROMPT = """Please extract all the text from this scanned document page and format it as markdown.
 
+Rules:
+- Output the content in markdown format
+- Preserve the document structure (headings, sections, lists, etc.)
+- Use appropriate markdown syntax:
+  * # for main headings, ## for subheadings, ### for sub-subheadings, etc.
+  * - or * for bullet points
+  * 1. 2. 3. for numbered lists
+  * **bold** for emphasized text if applicable
+  * Tables should use markdown table syntax if present
+  * Code blocks with ``` if code is present
+  * > for blockquotes if applicable
+- Maintain paragraph breaks with blank lines between paragraphs
+- Include all text exactly as it appears
+- Infer the document structure from visual cues (font size, weight, indentation, etc.)
+- Do not add any commentary or explanations
+- Just output the formatted markdown content
 
-def contains_api_error(text):
-    """
-    Check if text contains API error messages.
-
-    Returns True if an API error is detected, False otherwise.
-    """
-    if not text:
-        return False
-
-    # Check for error patterns
-    error_patterns = [
-        r'\[Error extracting page \d+:.*Error code:.*\]',
-        r'Error code: \d+',
-        r'invalid_request_error',
-        r'authentication_error',
-        r'permission_error',
-        r'rate_limit_error',
-        r'api_error',
-        r'overloaded_error',
-        r'credit balance is too low',
-        r'Your credit balance is too low to access the Anthropic API',
-    ]
-
-    for pattern in error_patterns:
-        if re.search(pattern, text, re.IGNORECASE):
-            return True
-
-    return False
-
-
-def pdf_to_images(pdf_path):
-    """Convert PDF pages to base64-encoded images."""
-    doc = fitz.open(pdf_path)
-    images = []
-
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-
-        # Render page to image (PNG) at 2x resolution for better quality
-        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-        img_data = pix.pil_tobytes(format="PNG")
-
-        # Encode to base64
-        img_base64 = base64.b64encode(img_data).decode('utf-8')
-        images.append(img_base64)
-
-    doc.close()
-    return images
-
-
-def extract_text_from_page_gemini(client, image_base64, page_num, output_format='markdown'):
-    """
-    Use Gemini to extract text from a single page image.
-
-    Args:
-        client: Google GenerativeAI model
-        image_base64: Base64-encoded image
-        page_num: Page number (0-indexed)
-        output_format: 'markdown' (default) or 'plain'
-    """
+Text:"""
 
-    if output_format == 'markdown':
-        prompt = """You are a precise document transcription tool. Extract all text from this scanned document page and output it as properly formatted markdown.
+_GEMINI_MARKDOWN_PROMPT = """You are a precise document transcription tool. Extract all text from this scanned document page and output it as properly formatted markdown.
 
 CRITICAL FORMATTING RULES:
 1. Analyze visual hierarchy (font size, weight, position) to determine heading levels
@@ -101,8 +94,8 @@ OUTPUT REQUIREMENTS:
 - Start directly with the content
 
 Begin extraction:"""
-    else:
-        prompt = """Please extract all the text from this scanned document page.
+
+_PLAIN_PROMPT = """Please extract all the text from this scanned document page.
 
 Rules:
 - Preserve the original formatting as much as possible
@@ -113,38 +106,697 @@ Rules:
 
 Text:"""
 
+
+# Wraps the single-page prompt when several pages are sent in one request
+_MULTI_PAGE_PREAMBLE = """The images above are {count} consecutive pages of the same document, pages {first} to {last}.
+Apply the extraction instructions to each page separately. Start the output for each page with a line containing only
+<!-- PAGE n -->
+where n is the page number given before its image, and output the pages in order.
+
+"""
+
+# Pages per vision request used by pdf-batch unless --batch-pages says otherwise
+DEFAULT_BATCH_PAGES = 4
+
+# Vision requests one PDF has in flight at once when extracted on its own
+DEFAULT_PAGE_WORKERS = 8
+
+# Rendered pages that may wait for a free request slot before rendering pauses
+RENDER_QUEUE_SIZE = 16
+
+# Smaller PDFs are rendered in-process; starting pool work costs more than it saves
+PARALLEL_RENDER_MIN_PAGES = 4
+
+# Pages a render pool worker renders per task, from a single open of the PDF
+RENDER_CHUNK_PAGES = 4
+
+# Splits a multi-page response on the per-page markers
+_PAGE_MARKER_RE = re.compile(r'^\s*<!--\s*PAGE\s+(\d+)\s*-->\s*$', re.MULTILINE)
+
+
+# Connection pool for the Anthropic clients. Over HTTP/2 concurrent requests
+# are multiplexed onto a few connections; idle ones are kept long enough to
+# survive rate limiter waits between pages.
+HTTP_MAX_CONNECTIONS = 32
+HTTP_MAX_KEEPALIVE = 16
+HTTP_KEEPALIVE_EXPIRY = 60.0
+CLIENT_MAX_RETRIES = 3
+
+
+def _http_limits():
+    """Return the httpx.Limits shared by make_claude_client() and make_claude_async_client()."""
+    import httpx
+
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def make_claude_client(api_key):
+    """
+    Create an Anthropic client for reuse across many pages and PDFs.
+
+    The client keeps HTTP/2 connections alive in the SDK's connection pool,
+    so later requests skip the TCP and TLS handshakes and concurrent
+    requests share connections. It is safe to share between threads.
+    """
+    from anthropic import Anthropic, DefaultHttpxClient
+
+    # DefaultHttpxClient keeps the SDK's own timeouts and redirect handling
+    http_client = DefaultHttpxClient(http2=True, limits=_http_limits())
+    return Anthropic(api_key=api_key, max_retries=CLIENT_MAX_RETRIES, http_client=http_client)
+
+
+def make_gemini_client(api_key):
+    """
+    Create a Google GenAI client for reuse across many pages and PDFs.
+
+    Like make_claude_client(), sharing one client keeps its HTTP connections
+    alive between requests instead of reconnecting for every PDF, and
+    requests that hit rate limits (429) or server errors (5xx) are retried
+    with exponential backoff, CLIENT_MAX_RETRIES times.
+    """
+    from google import genai
+    from google.genai import types
+
+    retry_options = types.HttpRetryOptions(attempts=CLIENT_MAX_RETRIES + 1)
+    return genai.Client(api_key=api_key, http_options=types.HttpOptions(retry_options=retry_options))
+
+
+@functools.lru_cache(maxsize=4)
+def shared_client(provider, api_key):
+    """
+    Return a client for provider ('claude' or 'gemini') that is reused across calls.
+
+    extract_pdf_text_with_mode() uses this when no client is passed, so
+    converting PDFs one call at a time still keeps the same pooled
+    connections instead of opening new ones for every PDF.
+    """
+    if provider == 'gemini':
+        return make_gemini_client(api_key)
+    return make_claude_client(api_key)
+
+
+@functools.lru_cache(maxsize=8)
+def get_prompt(provider, output_format='markdown'):
+    """Return the extraction prompt for a provider ('claude' or 'gemini') and output format."""
+    if output_format != 'markdown':
+        return _PLAIN_PROMPT
+    if provider == 'gemini':
+        return _GEMINI_MARKDOWN_PROMPT
+    return _CLAUDE_MARKDOWN_PROMPT
+
+
+@functools.lru_cache(maxsize=8)
+def extraction_config_key(mode, output_format='markdown', batch_pages=1, dpi=DEFAULT_DPI, force_vision=False):
+    """
+    Return a short digest identifying everything that shapes extraction output.
+
+    Covers the mode, model, prompt, page batching and image settings, and
+    which pages keep their embedded text (the native-text thresholds, or
+    force_vision for the claude and gemini modes), so cached results are
+    invalidated whenever any of them change.
+    """
+    mode = (mode or 'claude').lower()
+    output_format = (output_format or 'markdown').lower()
+    if mode == 'gemini':
+        parts = [mode, GEMINI_MODEL, get_prompt('gemini', output_format)]
+        if batch_pages > 1:
+            parts.append(_MULTI_PAGE_PREAMBLE)
+    elif mode in ('spacy', 'local'):
+        parts = ['spacy', 'en_core_web_sm']
+    elif mode == 'auto':
+        parts = [mode, CLAUDE_MODEL, 'system', get_prompt('claude', output_format), str(NATIVE_TEXT_MIN_CHARS)]
+        if batch_pages > 1:
+            parts.append(_MULTI_PAGE_PREAMBLE)
+    else:
+        parts = [mode, CLAUDE_MODEL, 'system', get_prompt('claude', output_format)]
+        if batch_pages > 1:
+            parts.append(_MULTI_PAGE_PREAMBLE)
+    if mode in ('claude', 'gemini'):
+        # Born-digital PDFs keep their text layer unless force_vision is set
+        parts.append('vision-all' if force_vision else f"native{NATIVE_TEXT_MIN_CHARS}-share{NATIVE_PDF_MIN_SHARE}")
+    if mode not in ('spacy', 'local'):
+        parts.append(f"{dpi}dpi-jpeg{JPEG_QUALITY}-max{MAX_LONG_EDGE}")
+    parts.append(output_format)
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+# API error messages that mark an extraction as incomplete, compiled once
+# into a single alternation so each text is scanned in one pass
+_API_ERROR_PATTERNS = [
+    r'\[Error extracting page \d+:.*Error code:.*\]',
+    r'Error code: \d+',
+    r'invalid_request_error',
+    r'authentication_error',
+    r'permission_error',
+    r'rate_limit_error',
+    r'api_error',
+    r'overloaded_error',
+    r'credit balance is too low',
+    r'Your credit balance is too low to access the Anthropic API',
+]
+_API_ERROR_RE = re.compile('|'.join(f'(?:{p})' for p in _API_ERROR_PATTERNS), re.IGNORECASE)
+# Same patterns for raw file bytes, so outputs can be scanned without decoding
+_API_ERROR_BYTES_RE = re.compile(_API_ERROR_RE.pattern.encode('utf-8'), re.IGNORECASE)
+
+
+def contains_api_error(text):
+    """
+    Check if text contains API error messages.
+
+    Accepts str or UTF-8 bytes (e.g. the raw head and tail of an output file).
+    Returns True if an API error is detected, False otherwise.
+    """
+    if not text:
+        return False
+
+    if isinstance(text, bytes):
+        return _API_ERROR_BYTES_RE.search(text) is not None
+    return _API_ERROR_RE.search(text) is not None
+
+
+# In auto mode, pages whose embedded text layer has at least this many
+# characters are used as-is instead of being sent to the vision API
+NATIVE_TEXT_MIN_CHARS = 100
+
+# Share of pages with a usable text layer at which the Claude and Gemini
+# modes treat a PDF as born-digital and only send the other pages to the API
+NATIVE_PDF_MIN_SHARE = 0.9
+
+
+def native_page_texts(pdf_path, min_chars=NATIVE_TEXT_MIN_CHARS):
+    """
+    Return the embedded text of each page of a born-digital PDF.
+
+    Args:
+        pdf_path: Path to the PDF
+        min_chars: Minimum number of characters for a text layer to be trusted
+
+    Returns:
+        List with one entry per page: the page's text, or None if the page
+        has too little usable text (e.g. a scan) and needs the vision API
+    """
+    import fitz  # PyMuPDF
+
+    texts = []
+    with FITZ_LOCK, fitz.open(pdf_path, filetype='pdf') as doc:
+        for page in doc:
+            text = page.get_text('text').strip()
+            # Fonts without a Unicode mapping extract as U+FFFD; treat those as scans
+            if len(text) >= min_chars and text.count('\ufffd') * 20 < len(text):
+                texts.append(text)
+            else:
+                texts.append(None)
+    return texts
+
+
+def _initial_page_texts(pdf_path, images, mode, force_vision=False):
+    """
+    Return page_texts for a vision extraction: native text, or None for pages to send.
+
+    The auto mode keeps every page's text layer. The other vision modes keep
+    them only when at least NATIVE_PDF_MIN_SHARE of the pages have one, so
+    born-digital PDFs cost few or no API calls; force_vision sends every page.
+    """
+    if mode == 'auto':
+        return native_page_texts(pdf_path)
+    if force_vision:
+        return [None] * (len(images) if images is not None else pdf_page_count(pdf_path))
+
+    texts = native_page_texts(pdf_path)
+    if texts and sum(text is not None for text in texts) >= NATIVE_PDF_MIN_SHARE * len(texts):
+        return texts
+    return [None] * len(texts)
+
+
+def vision_page_numbers(pdf_path, mode='claude', force_vision=False):
+    """
+    Return the 0-indexed pages a vision extraction sends to the API as images.
+
+    The other pages are extracted from their embedded text, so callers that
+    render ahead of time (see the images argument of
+    extract_pdf_text_with_mode()) only need to render these.
+    """
+    page_texts = _initial_page_texts(pdf_path, None, mode, force_vision)
+    return {n for n, text in enumerate(page_texts) if text is None}
+
+
+def has_text_layer(doc, min_chars=NATIVE_TEXT_MIN_CHARS):
+    """
+    Return True if any page of an open PyMuPDF document has at least min_chars characters of embedded text.
+
+    The caller holds FITZ_LOCK, as for any use of the document.
+    """
+    return any(len(page.get_text('text').strip()) >= min_chars for page in doc)
+
+
+def render_dpi(width, height, dpi=DEFAULT_DPI, max_long_edge=MAX_LONG_EDGE):
+    """Return the resolution a width x height point page is rendered at, after the max_long_edge cap."""
+    long_edge = max(width, height)
+    if max_long_edge and long_edge > 0:
+        return min(dpi, max_long_edge * 72 / long_edge)
+    return dpi
+
+
+def _encode_page(page, dpi, max_long_edge=MAX_LONG_EDGE, as_bytes=False):
+    """
+    Render a PyMuPDF page and return it as a base64-encoded JPEG (or the raw JPEG bytes).
+
+    Takes FITZ_LOCK only for the render, so the base64 encoding lets other
+    threads use PyMuPDF meanwhile.
+    """
+    import fitz  # PyMuPDF
+
+    with FITZ_LOCK:
+        # Scale from points to pixels, shrinking pages whose long edge would
+        # exceed max_long_edge
+        scale = render_dpi(page.rect.width, page.rect.height, dpi, max_long_edge) / 72
+
+        # Render page and encode as JPEG directly from the pixmap. The pixmap
+        # is not kept, so its raw pixels are freed before the base64 copy is made.
+        img_data = page.get_pixmap(matrix=fitz.Matrix(scale, scale)).tobytes(output="jpeg", jpg_quality=JPEG_QUALITY)
+    if as_bytes:
+        return img_data
+
+    # Encode to base64
+    return b64encode_str(img_data)
+
+
+def render_page(pdf_path, page_num, dpi=DEFAULT_DPI, max_long_edge=MAX_LONG_EDGE):
+    """
+    Render one page of a PDF as a base64-encoded JPEG.
+
+    A top-level function so it can run in a multiprocessing pool.
+    """
+    return render_pages(pdf_path, [page_num], dpi, max_long_edge)[0]
+
+
+def render_pages(pdf_path, page_nums, dpi=DEFAULT_DPI, max_long_edge=MAX_LONG_EDGE, as_bytes=False):
+    """
+    Render several pages of a PDF as base64-encoded JPEGs, opening it once.
+
+    A top-level function so it can run in a multiprocessing pool. With
+    as_bytes, returns the raw JPEG bytes instead.
+    """
+    import fitz  # PyMuPDF
+
+    with FITZ_LOCK, fitz.open(pdf_path, filetype='pdf') as doc:
+        return [_encode_page(doc[n], dpi, max_long_edge, as_bytes) for n in page_nums]
+
+
+def _render_pages_task(args):
+    """Pool.imap() adapter for render_pages()."""
+    return render_pages(*args)
+
+
+def _render_in_pool(pool, pdf_path, page_nums, dpi, max_long_edge=MAX_LONG_EDGE, as_bytes=False):
+    """
+    Render pages in a process pool, yielding (page_number, image) in order.
+
+    Each task renders RENDER_CHUNK_PAGES consecutive entries of page_nums,
+    so a worker parses the PDF once per chunk rather than once per page.
+    """
+    chunks = [page_nums[k:k + RENDER_CHUNK_PAGES] for k in range(0, len(page_nums), RENDER_CHUNK_PAGES)]
+    tasks = [(pdf_path, chunk, dpi, max_long_edge, as_bytes) for chunk in chunks]
+    for chunk, images in zip(chunks, pool.imap(_render_pages_task, tasks)):
+        yield from zip(chunk, images)
+
+
+def _init_render_worker():
+    """Process pool initializer: leave Ctrl-C handling to the main process."""
+    import signal
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def make_render_pool(processes=None):
+    """
+    Create a process pool for pdf_to_images() and iter_pdf_images().
+
+    Rendering and JPEG encoding are CPU-bound, so separate processes scale
+    past the GIL. Uses the spawn start method, which is safe alongside
+    threads. Defaults to half the CPUs, leaving room for the rest of the
+    pipeline. The caller closes it.
+    """
+    import multiprocessing
+
+    if processes is None:
+        processes = max(1, (os.cpu_count() or 2) // 2)
+    return multiprocessing.get_context('spawn').Pool(processes=processes, initializer=_init_render_worker)
+
+
+def pdf_to_images(pdf_path, pages=None, dpi=DEFAULT_DPI, pool=None, max_long_edge=MAX_LONG_EDGE, num_workers=None, as_bytes=False):
+    """
+    Convert PDF pages to base64-encoded JPEG images.
+
+    Args:
+        pdf_path: Path to the PDF
+        pages: Optional collection of 0-indexed page numbers to render. Other
+            pages are left as None in the returned list.
+        dpi: Render resolution. Raise it for small print in poor scans.
+        pool: Optional multiprocessing pool (see make_render_pool()) to render
+            pages in parallel; each worker opens the PDF itself. PDFs with
+            fewer than PARALLEL_RENDER_MIN_PAGES pages are rendered here.
+        max_long_edge: Cap on the longest side of each image in pixels; larger
+            pages are rendered below dpi. None renders every page at dpi.
+        num_workers: Without a pool, render on a temporary pool of this many
+            processes. Only started for PDFs with at least
+            PARALLEL_RENDER_MIN_PAGES pages, so short ones skip its startup cost;
+            pass a pool instead when converting many PDFs.
+        as_bytes: Return raw JPEG bytes instead of base64 strings. Gemini
+            takes them as they are; only Claude needs base64.
+    """
+    page_count = pdf_page_count(pdf_path)
+    wanted = [n for n in range(page_count) if pages is None or n in pages]
+
+    own_pool = pool is None and num_workers and num_workers > 1 and len(wanted) >= PARALLEL_RENDER_MIN_PAGES
+    if own_pool:
+        pool = make_render_pool(num_workers)
+
     try:
-        from PIL import Image
-        import io
-        import warnings
+        if pool is None or len(wanted) < PARALLEL_RENDER_MIN_PAGES:
+            rendered = dict(_render_here(pdf_path, wanted, dpi, max_long_edge, as_bytes))
+        else:
+            rendered = dict(_render_in_pool(pool, pdf_path, wanted, dpi, max_long_edge, as_bytes))
+    finally:
+        if own_pool:
+            pool.terminate()
+
+    return [rendered.get(n) for n in range(page_count)]
+
+
+def pdf_page_count(pdf_path):
+    """Return the number of pages in a PDF."""
+    import fitz  # PyMuPDF
+
+    with FITZ_LOCK, fitz.open(pdf_path) as doc:
+        return doc.page_count
+
 
-        # Decode base64 image
-        img_data = base64.b64decode(image_base64)
-        image = Image.open(io.BytesIO(img_data))
+def pdf_page_sizes(pdf_path):
+    """Return the (width, height) of each page of a PDF in points."""
+    import fitz  # PyMuPDF
 
-        # Generate content using new google-genai API
-        response = client.models.generate_content(
-            model='gemini-2.5-flash-image',
-            contents=[prompt, image]
-        )
+    with FITZ_LOCK, fitz.open(pdf_path) as doc:
+        return [(page.rect.width, page.rect.height) for page in doc]
 
-        # Extract text from response, suppressing non-text parts warning
-        # Gemini may include inline_data parts which we don't need for text extraction
-        with warnings.catch_warnings():
-            warnings.filterwarnings("ignore", message=".*non-text parts.*")
-            text = response.text
 
-        # Clean up any "Text:" prefix if Gemini added it
-        if text.startswith("Text:"):
-            text = text[5:].strip()
+def iter_pdf_images(pdf_path, pages=None, dpi=DEFAULT_DPI, pool=None, max_long_edge=MAX_LONG_EDGE, as_bytes=False):
+    """
+    Render PDF pages one at a time as base64-encoded JPEGs.
+
+    Like pdf_to_images(), but yields (page_number, image) pairs in page
+    order as each page is rendered instead of building the whole list first.
+    Safe to run on another thread (see _prefetch()): FITZ_LOCK is held while
+    a page renders, never across a yield.
+    """
+    wanted = [n for n in range(pdf_page_count(pdf_path)) if pages is None or n in pages]
+    if pool is None or len(wanted) < PARALLEL_RENDER_MIN_PAGES:
+        yield from _render_here(pdf_path, wanted, dpi, max_long_edge, as_bytes)
+    else:
+        yield from _render_in_pool(pool, pdf_path, wanted, dpi, max_long_edge, as_bytes)
+
+
+def _render_here(pdf_path, page_nums, dpi, max_long_edge=MAX_LONG_EDGE, as_bytes=False):
+    """
+    Render pages in this process, yielding (page_number, image) in order.
+
+    FITZ_LOCK is taken per page, so other threads can use PyMuPDF between
+    pages and while the caller handles each image.
+    """
+    import fitz  # PyMuPDF
+
+    with FITZ_LOCK:
+        doc = fitz.open(pdf_path, filetype='pdf')
+    try:
+        for n in page_nums:
+            # The page object is freed as the call returns, still under the lock
+            with FITZ_LOCK:
+                image = _encode_page(doc[n], dpi, max_long_edge, as_bytes)
+            yield n, image
+    finally:
+        with FITZ_LOCK:
+            doc.close()
+
+
+def _prefetch(iterable, maxsize=RENDER_QUEUE_SIZE):
+    """
+    Run iterable on a background thread and yield its items as they arrive.
+
+    The producer may render with PyMuPDF: it holds FITZ_LOCK while it does,
+    as does every other fitz use, so one thread at a time touches it.
+
+    At most maxsize items wait in between, so the producer blocks when the
+    consumer falls behind. Exceptions from the producer are re-raised here.
+    Closing the generator early stops the producer.
+    """
+    q = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    end = object()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                q.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((end, e))
+            return
+        put((end, None))
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item, error = q.get()
+            if item is end:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def _vision_pages(pdf_path, images, page_texts, dpi, pool=None, as_bytes=False):
+    """
+    Return the (page_number, image) pairs for the pages page_texts leaves as None.
+
+    Uses the caller's pre-rendered images when given; otherwise the pages
+    are rendered on a background thread while earlier pages are already
+    being sent to the API, as raw JPEG bytes if as_bytes is set.
+    """
+    if images is not None:
+        return _vision_inputs(images, page_texts)
+    wanted = {i for i, text in enumerate(page_texts) if text is None}
+    return _prefetch(iter_pdf_images(pdf_path, wanted, dpi, pool, as_bytes=as_bytes))
+
 
-        return text
+def _claude_image(image_base64):
+    """Return a Claude image content block for a base64-encoded page image."""
+    return {
+        "type": "image",
+        "source": {
+            "type": "base64",
+            "media_type": IMAGE_MEDIA_TYPE,
+            "data": image_base64
+        }
+    }
 
+
+def _claude_system(output_format):
+    """
+    Return the system blocks carrying the Claude extraction prompt.
+
+    The prompt is the same for every page, so it is marked for prompt
+    caching instead of being repeated in each request's user content.
+    """
+    return [{"type": "text", "text": get_prompt('claude', output_format), "cache_control": {"type": "ephemeral"}}]
+
+
+def _claude_batch_content(images_base64, first_page):
+    """Build the message content for a multi-page Claude request."""
+    count = len(images_base64)
+    content = []
+    for offset, image_base64 in enumerate(images_base64):
+        content.append({"type": "text", "text": f"Page {first_page + offset + 1}:"})
+        content.append(_claude_image(image_base64))
+    preamble = _MULTI_PAGE_PREAMBLE.format(count=count, first=first_page + 1, last=first_page + count)
+    content.append({"type": "text", "text": preamble.rstrip()})
+    return content
+
+
+def _gemini_image(image):
+    """
+    Return a page image as content google-genai accepts.
+
+    JPEG bytes are sent as they are in a Part, so they are neither parsed
+    by PIL nor re-encoded by the SDK; base64 strings are decoded first. PIL
+    images are passed through untouched.
+    """
+    from google.genai import types
+    from PIL import Image
+
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, str):
+        image = b64decode(image)
+    return types.Part.from_bytes(data=image, mime_type=IMAGE_MEDIA_TYPE)
+
+
+def _gemini_batch_contents(images_base64, first_page, output_format):
+    """Build the contents for a multi-page Gemini request."""
+    count = len(images_base64)
+    contents = []
+    for offset, image_base64 in enumerate(images_base64):
+        contents.append(f"Page {first_page + offset + 1}:")
+        contents.append(_gemini_image(image_base64))
+    preamble = _MULTI_PAGE_PREAMBLE.format(count=count, first=first_page + 1, last=first_page + count)
+    contents.append(preamble + get_prompt('gemini', output_format))
+    return contents
+
+
+def _gemini_text(response):
+    """Return the text of a Gemini response."""
+    import warnings
+
+    # Suppress the non-text parts warning: Gemini may include inline_data
+    # parts which we don't need for text extraction
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message=".*non-text parts.*")
+        text = response.text
+    # Safety blocks and empty candidates come back without any text
+    if text is None:
+        raise ValueError("Gemini returned no text (response blocked or empty)")
+    return text
+
+
+def _page_content(provider, image_base64, output_format):
+    """Build the request content for a single page."""
+    if provider == 'gemini':
+        return [get_prompt('gemini', output_format), _gemini_image(image_base64)]
+    return [_claude_image(image_base64)]
+
+
+def _batch_content(provider, images_base64, first_page, output_format):
+    """Build the request content for several consecutive pages."""
+    if provider == 'gemini':
+        return _gemini_batch_contents(images_base64, first_page, output_format)
+    return _claude_batch_content(images_base64, first_page)
+
+
+def _clean_page_text(text):
+    """Remove the "Text:" prefix the models sometimes echo from the prompt."""
+    return text.lstrip().removeprefix("Text:").lstrip()
+
+
+def _request(provider, client, content, output_format, max_tokens, rate_limiter, est_tokens):
+    """Send one vision request and return the response text."""
+    if rate_limiter:
+        rate_limiter.acquire(est_tokens=est_tokens)
+
+    if provider == 'gemini':
+        response = client.models.generate_content(model=GEMINI_MODEL, contents=content)
+        return _gemini_text(response)
+
+    # Use the raw response so the rate limit headers are available
+    response = client.messages.with_raw_response.create(
+        model=CLAUDE_MODEL,
+        max_tokens=max_tokens,
+        system=_claude_system(output_format),
+        messages=[{"role": "user", "content": content}]
+    )
+    if rate_limiter:
+        rate_limiter.update_from_headers(response.headers)
+    message = response.parse()
+    return message.content[0].text
+
+
+def is_fatal_api_error(exc):
+    """
+    Return True if an API exception will fail every later request as well.
+
+    Invalid keys, missing permissions and an exhausted credit balance are
+    not worth retrying page by page, unlike rate limits or overloads. Works
+    on the exceptions of both SDKs: Anthropic's carry .status_code,
+    google-genai's carry .code.
+    """
+    status = getattr(exc, 'status_code', None) or getattr(exc, 'code', None)
+    if status in (401, 403):
+        return True
+    return status == 400 and 'credit balance' in str(exc).lower()
+
+
+def _extract_page(provider, client, image_base64, page_num, output_format, rate_limiter):
+    """Shared body of extract_text_from_page() and extract_text_from_page_gemini()."""
+    try:
+        content = _page_content(provider, image_base64, output_format)
+        text = _request(provider, client, content, output_format, 4096, rate_limiter, EST_TOKENS_PER_PAGE)
+        # Inside the try, so an unusable response fails this page only
+        return _clean_page_text(text)
     except Exception as e:
+        if is_fatal_api_error(e):
+            raise RuntimeError(f"API error on page {page_num + 1}: {e}") from e
         return f"[Error extracting page {page_num + 1}: {e}]"
 
 
-def extract_text_from_page(client, image_base64, page_num, output_format='markdown'):
+def _extract_pages(provider, client, images_base64, first_page, output_format, rate_limiter):
+    """Shared body of extract_text_from_pages() and extract_text_from_pages_gemini()."""
+    count = len(images_base64)
+    try:
+        content = _batch_content(provider, images_base64, first_page, output_format)
+        text = _request(provider, client, content, output_format, 4096 * count, rate_limiter, EST_TOKENS_PER_PAGE * count)
+    except Exception as e:
+        if is_fatal_api_error(e):
+            raise RuntimeError(f"API error on page {first_page + 1}: {e}") from e
+        return None
+    return _split_pages(text, first_page, count)
+
+
+def extract_text_from_page_gemini(client, image_base64, page_num, output_format='markdown', rate_limiter=None):
+    """
+    Use Gemini to extract text from a single page image.
+
+    Args:
+        client: Google GenerativeAI model
+        image_base64: Base64-encoded image; raw image bytes or a PIL image also work
+        page_num: Page number (0-indexed)
+        output_format: 'markdown' (default) or 'plain'
+        rate_limiter: Optional TokenBucket shared by concurrent callers
+    """
+    return _extract_page('gemini', client, image_base64, page_num, output_format, rate_limiter)
+
+
+def extract_text_from_pages_gemini(client, images_base64, first_page, output_format='markdown', rate_limiter=None):
+    """
+    Use Gemini to extract text from several consecutive page images in one request.
+
+    Args:
+        client: Google GenerativeAI client
+        images_base64: List of base64-encoded page images (or raw bytes or PIL images)
+        first_page: Page number of the first image (0-indexed)
+        output_format: 'markdown' (default) or 'plain'
+        rate_limiter: Optional TokenBucket shared by concurrent callers
+
+    Returns:
+        List with the text of each page, or None if the request failed or the
+        response could not be split into one block per page
+    """
+    return _extract_pages('gemini', client, images_base64, first_page, output_format, rate_limiter)
+
+
+def extract_text_from_page(client, image_base64, page_num, output_format='markdown', rate_limiter=None):
     """
     Use Claude to extract text from a single page image.
 
@@ -153,196 +805,489 @@ def extract_text_from_page(client, image_base64, page_num, output_format='markdo
         image_base64: Base64-encoded image
         page_num: Page number (0-indexed)
         output_format: 'markdown' (default) or 'plain'
+        rate_limiter: Optional TokenBucket shared by concurrent callers; it is
+            kept in sync with the anthropic-ratelimit-* response headers
     """
+    return _extract_page('claude', client, image_base64, page_num, output_format, rate_limiter)
 
-    if output_format == 'markdown':
-        prompt = """Please extract all the text from this scanned document page and format it as markdown.
 
-Rules:
-- Output the content in markdown format
-- Preserve the document structure (headings, sections, lists, etc.)
-- Use appropriate markdown syntax:
-  * # for main headings, ## for subheadings, ### for sub-subheadings, etc.
-  * - or * for bullet points
-  * 1. 2. 3. for numbered lists
-  * **bold** for emphasized text if applicable
-  * Tables should use markdown table syntax if present
-  * Code blocks with ``` if code is present
-  * > for blockquotes if applicable
-- Maintain paragraph breaks with blank lines between paragraphs
-- Include all text exactly as it appears
-- Infer the document structure from visual cues (font size, weight, indentation, etc.)
-- Do not add any commentary or explanations
-- Just output the formatted markdown content
+def extract_text_from_pages(client, images_base64, first_page, output_format='markdown', rate_limiter=None):
+    """
+    Use Claude to extract text from several consecutive page images in one request.
 
-Text:"""
-    else:
-        prompt = """Please extract all the text from this scanned document page.
+    Args:
+        client: Anthropic client
+        images_base64: List of base64-encoded page images
+        first_page: Page number of the first image (0-indexed)
+        output_format: 'markdown' (default) or 'plain'
+        rate_limiter: Optional TokenBucket shared by concurrent callers
 
-Rules:
-- Preserve the original formatting as much as possible
-- Maintain paragraph breaks and line breaks
-- Include all text exactly as it appears
-- Do not add any commentary or explanations
-- Just output the raw text content
+    Returns:
+        List with the text of each page, or None if the request failed or the
+        response could not be split into one block per page
+    """
+    return _extract_pages('claude', client, images_base64, first_page, output_format, rate_limiter)
 
-Text:"""
 
-    try:
-        message = client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=4096,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/png",
-                                "data": image_base64
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": prompt
-                        }
-                    ]
-                }
-            ]
-        )
-
-        # Extract text from response
-        text = message.content[0].text
-
-        # Clean up any "Text:" prefix if Claude added it
-        if text.startswith("Text:"):
-            text = text[5:].strip()
-
-        return text
+# Vision providers: (batched extractor, single-page extractor, whether page
+# images are passed as raw JPEG bytes rather than base64)
+_VISION_PROVIDERS = {
+    'claude': (extract_text_from_pages, extract_text_from_page, False),
+    'gemini': (extract_text_from_pages_gemini, extract_text_from_page_gemini, True),
+}
 
-    except Exception as e:
-        return f"[Error extracting page {page_num + 1}: {e}]"
 
+def _split_pages(text, first_page, count):
+    """
+    Split a multi-page response on its <!-- PAGE n --> markers.
 
-def extract_pdf_text(pdf_path, output_path, api_key, progress_callback=None):
-    return extract_pdf_text_with_mode(pdf_path, output_path, api_key=api_key, progress_callback=progress_callback, mode='claude')
+    Returns the text of each of the count pages starting at first_page
+    (0-indexed), or None unless every page came back exactly once.
+    """
+    parts = _PAGE_MARKER_RE.split(text or '')
+    pages = {}
+    for number, page_text in zip(parts[1::2], parts[2::2]):
+        pages.setdefault(int(number), page_text.strip())
+    expected = range(first_page + 1, first_page + count + 1)
+    if sorted(pages) != list(expected):
+        return None
 
+    return [_clean_page_text(pages[number]) for number in expected]
 
-def extract_pdf_text_with_mode(pdf_path, output_path, api_key=None, progress_callback=None, mode='claude', output_format='markdown', provider='claude'):
-    """
-    Extract text from PDF using different modes.
 
-    Args:
-        pdf_path: Path to input PDF
-        output_path: Path to output file (will contain markdown by default)
-        api_key: API key (Anthropic for Claude, Google for Gemini)
-        progress_callback: Optional callback function for progress updates
-        mode: 'claude' (default), 'gemini', or 'spacy'/'local' (layout-based extraction)
-        output_format: 'markdown' (default) or 'plain' - controls the extraction format
-        provider: 'claude' (default) or 'gemini' - which AI provider to use
+def _vision_inputs(images, page_texts):
+    """Yield (page_number, image) for each page whose entry in page_texts is None."""
+    for i, text in enumerate(page_texts):
+        if text is None:
+            yield i, images[i]
 
-    mode: 'claude' (default), 'gemini', or 'spacy'/'local' (layout-based extraction using spacy-layout)
-    If mode in ('claude', 'gemini'), `api_key` must be provided. If mode == 'spacy'/'local', no API key is required.
-    The spacy mode uses the spacy-layout library with the en_core_web_sm model for layout-aware
-    text extraction from PDFs, including support for scanned documents via integrated OCR.
 
-    Returns:
-        tuple: (total_pages, page_timings, total_time) where page_timings is a list of (page_num, time_seconds)
+def _vision_batches(pages, batch_pages):
     """
+    Group the pages that still need the vision API into requests.
 
-    mode = (mode or 'claude').lower()
-    output_format = (output_format or 'markdown').lower()
-    provider = (provider or 'claude').lower()
+    Args:
+        pages: (page_number, image) pairs in page order, e.g. from
+            _vision_inputs() or iter_pdf_images(); consumed lazily
+        batch_pages: Maximum number of pages per request
 
-    # For backward compatibility: mode can also specify provider
-    if mode in ('claude', 'gemini'):
-        provider = mode
-        mode = provider  # Keep mode in sync
+    Yields (first_page, images) for runs of at most batch_pages
+    consecutive pages.
+    """
+    batch_start, batch = None, []
+    for i, image in pages:
+        if batch and (i != batch_start + len(batch) or len(batch) == batch_pages):
+            yield batch_start, batch
+            batch_start, batch = None, []
+        if batch_start is None:
+            batch_start = i
+        batch.append(image)
+    if batch:
+        yield batch_start, batch
+
+
+def _extract_vision_batch(client, batch, batch_start, extract_batch, extract_page, output_format, rate_limiter, progress_callback=None, total_pages=None):
+    """
+    Extract one batch of consecutive pages from _vision_batches().
 
-    all_text = []
-    page_timings = []  # Track timing for each page
-    failed_pages = []  # Track failed page numbers
-    start_time = time.time()
+    The batch goes to extract_batch() in one request; single pages, and the
+    pages of a batch that fails, go through extract_page() one request
+    each. progress_callback, if given, is called before each request.
 
-    if mode == 'claude' or provider == 'claude':
-        if not api_key:
-            raise ValueError('api_key is required when mode="claude"')
+    Returns (texts, timings) where timings is a list of (page_number, seconds).
+    """
+    if len(batch) > 1:
+        batch_time_start = time.time()
+        if progress_callback:
+            progress_callback(batch_start + 1, total_pages)
+        texts = extract_batch(client, batch, batch_start, output_format=output_format, rate_limiter=rate_limiter)
+        if texts is not None:
+            # Spread the request time evenly over its pages
+            page_time = (time.time() - batch_time_start) / len(batch)
+            return texts, [(batch_start + offset + 1, page_time) for offset in range(len(batch))]
+
+    # Single page, or the batched request failed: one request per page
+    texts, timings = [], []
+    for offset, img_base64 in enumerate(batch):
+        i = batch_start + offset
+        page_start = time.time()
+
+        if progress_callback:
+            progress_callback(i + 1, total_pages)
+
+        texts.append(extract_page(client, img_base64, i, output_format=output_format, rate_limiter=rate_limiter))
+        timings.append((i + 1, time.time() - page_start))
+    return texts, timings
+
+
+def _page_cache_lookup(pages, page_texts, config_key, cache_paths, on_hit=None):
+    """
+    Pass on the (page_number, image) pairs whose text is not in the page cache.
+
+    Hits are written straight into page_texts and reported to on_hit(page_number);
+    the cache path of each miss is recorded in cache_paths for _page_cache_store().
+    """
+    for i, image in pages:
+        cache_path = page_cache_path(image, config_key)
+        text = load_page_text(cache_path)
+        if text is not None:
+            page_texts[i] = text
+            if on_hit:
+                on_hit(i)
+            continue
+        cache_paths[i] = cache_path
+        yield i, image
+
+
+def _page_cache_store(cache_paths, batch_start, texts):
+    """Cache the texts of a finished batch, except pages that came back as API errors."""
+    for offset, text in enumerate(texts):
+        cache_path = cache_paths.pop(batch_start + offset, None)
+        if cache_path is not None and not contains_api_error(text):
+            store_page_text(cache_path, text)
+
+
+def _iter_vision_pages(client, pages, page_texts, batch_pages, extract_batch, extract_page, output_format, rate_limiter, progress_callback, max_workers=1, page_cache_key=None):
+    """
+    Fill in the None entries of page_texts by sending their images to a vision API.
 
-        # Convert PDF to images for Claude vision API
-        images = pdf_to_images(pdf_path)
-        total_pages = len(images)
+    pages yields (page_number, image) for those entries, and may still be
+    rendering them: each batch is sent as soon as its pages arrive.
 
-        # Initialize Claude client
-        client = Anthropic(api_key=api_key)
+    Consecutive pages are sent batch_pages at a time (see
+    _extract_vision_batch()). With max_workers > 1 up to that many requests
+    run at once on a thread pool, and progress_callback reports the number
+    of pages finished rather than the page about to be sent.
 
-        for i, img_base64 in enumerate(images):
-            page_start = time.time()
+    With page_cache_key, pages whose image was extracted before with the
+    same settings are taken from the page cache instead of the API.
 
+    This is a generator: each time batches finish, their texts are stored
+    in page_texts and their (page_number, seconds) timings are yielded.
+    Closing it early cancels the requests not yet started.
+    """
+    total_pages = len(page_texts)
+    batch_pages = max(1, batch_pages or 1)
+    pages_done = total_pages - sum(text is None for text in page_texts)
+    cache_paths = {}
+
+    def cache_hit(i):
+        nonlocal pages_done
+        pages_done += 1
+        if progress_callback:
+            progress_callback(pages_done if max_workers > 1 else i + 1, total_pages)
+
+    if page_cache_key:
+        pages = _page_cache_lookup(pages, page_texts, page_cache_key, cache_paths, cache_hit)
+    batches = _vision_batches(pages, batch_pages)
+
+    def finish(batch_start, texts):
+        page_texts[batch_start:batch_start + len(texts)] = texts
+        if page_cache_key:
+            _page_cache_store(cache_paths, batch_start, texts)
+
+    if max_workers <= 1:
+        for batch_start, batch in batches:
+            texts, timings = _extract_vision_batch(
+                client, batch, batch_start, extract_batch, extract_page,
+                output_format, rate_limiter, progress_callback, total_pages
+            )
+            batch = None
+            finish(batch_start, texts)
+            yield timings
+        return
+
+    pending = {}  # future -> first page of its batch
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def collect(return_when):
+        nonlocal pages_done
+        done, _ = wait(pending, return_when=return_when)
+        finished = []
+        # Results are collected on this thread, so no locking is needed
+        for future in done:
+            batch_start = pending.pop(future)
+            texts, timings = future.result()
+            finish(batch_start, texts)
+            finished.extend(timings)
+            pages_done += len(texts)
             if progress_callback:
-                progress_callback(i + 1, total_pages)
+                progress_callback(pages_done, total_pages)
+        return finished
 
-            text = extract_text_from_page(client, img_base64, i, output_format=output_format)
+    try:
+        # Submit in a window of two batches per worker rather than all at
+        # once, bounding the requests queued ahead of the workers
+        for batch_start, batch in batches:
+            if len(pending) >= 2 * max_workers:
+                yield collect(FIRST_COMPLETED)
+            future = executor.submit(
+                _extract_vision_batch, client, batch, batch_start, extract_batch, extract_page,
+                output_format, rate_limiter
+            )
+            pending[future] = batch_start
+            batch = None
+        while pending:
+            yield collect(FIRST_COMPLETED)
+    finally:
+        # Don't start queued requests after a failure, interrupt or close()
+        executor.shutdown(cancel_futures=True)
+
+
+class _PageWriter:
+    """
+    Streams the finished pages of page_texts to output_path in page order.
+
+    Each page is written as soon as it and every page before it are done,
+    so the output is never joined into one string and written pages are
+    dropped from page_texts. Callers that already have the pages in order
+    can pass them to write_page() instead of giving page_texts.
+    Only pages that came back from an API request are checked for error
+    messages; embedded text and page cache hits are written as they are,
+    even when they quote one.
+    Pages go to output_path + '.part' until the
+    extraction ends, so output_path only ever holds a complete extraction;
+    on close the failed-pages warning is put at the top, as _write_output()
+    does. Use as a context manager: the partial file is removed if the
+    extraction raises.
+    """
 
-            page_time = time.time() - page_start
-            page_timings.append((i + 1, page_time))
+    def __init__(self, output_path, page_texts=None):
+        self.output_path = output_path
+        self.part_path = f"{output_path}.part"
+        self.page_texts = page_texts
+        self.failed_pages = []
+        self._requested = set()
+        self._next = 0
+        self._written = 0
+        self._file = None
+
+    def __enter__(self):
+        fd = os.open(self.part_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        self._file = os.fdopen(fd, 'w', encoding='utf-8')
+        return self
+
+    def write_page(self, page_num, text, requested=True):
+        """
+        Write the next page of the document (page_num is 1-based).
+
+        requested says whether text came back from an API request, and so
+        may be an error message instead.
+        """
+        # Pages with API errors are skipped and reported in the warning
+        if requested and contains_api_error(text):
+            self.failed_pages.append(page_num)
+            return
+        # Header and text are written separately so the page text isn't
+        # copied into a new string
+        if self._written:
+            self._file.write("\n\n")
+        self._file.write(f"<!-- PAGE {page_num} -->\n")
+        self._file.write(text)
+        self._written += 1
+
+    def write_ready(self, requested=()):
+        """
+        Write the pages of page_texts that are done and follow the last written page.
+
+        requested holds the 0-based indices just filled in by API requests;
+        the other pages are not checked for error messages.
+        """
+        self._requested.update(requested)
+        page_texts = self.page_texts
+        while self._next < len(page_texts) and page_texts[self._next] is not None:
+            self.write_page(self._next + 1, page_texts[self._next], self._next in self._requested)
+            self._requested.discard(self._next)
+            page_texts[self._next] = ''
+            self._next += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None and self.page_texts is not None:
+                self.write_ready()
+            self._file.close()
+            if exc_type is not None:
+                return
+
+            # Check if all pages failed
+            if not self._written:
+                error_msg = f"All pages failed during extraction. Failed pages: {', '.join(map(str, self.failed_pages))}"
+                raise RuntimeError(error_msg)
+
+            if not self.failed_pages:
+                os.replace(self.part_path, self.output_path)
+                return
+
+            # Add warning about failed pages at the beginning
+            warning = f"⚠️  WARNING: The following pages failed to extract and were skipped: {', '.join(map(str, self.failed_pages))}\n\n"
+            with open(self.output_path, 'w', encoding='utf-8') as out, open(self.part_path, 'r', encoding='utf-8') as part:
+                out.write(warning)
+                shutil.copyfileobj(part, out)
+        finally:
+            if os.path.exists(self.part_path):
+                os.unlink(self.part_path)
+
+
+def _resolve_mode(mode, output_format, provider):
+    """Normalize extract_pdf_text_with_mode()'s mode, output_format and provider."""
+    mode = (mode or 'claude').lower()
+    output_format = (output_format or 'markdown').lower()
+    provider = (provider or 'claude').lower()
 
-            # Check for API errors after each page
-            if contains_api_error(text):
-                failed_pages.append(i + 1)
-                # Skip this page but continue with the rest
-                continue
+    # For backward compatibility: mode can also specify provider
+    if mode in ('claude', 'gemini'):
+        provider = mode
+    elif mode == 'auto':
+        provider = 'claude'
+    return mode, output_format, provider
 
-            all_text.append(f"<!-- PAGE {i + 1} -->\n{text}")
 
-    elif mode == 'gemini' or provider == 'gemini':
-        if not api_key:
-            raise ValueError('api_key is required when mode="gemini"')
+def iter_pdf_text_with_mode(pdf_path, api_key=None, progress_callback=None, mode='claude', output_format='markdown', provider='claude', images=None, rate_limiter=None, batch_pages=1, dpi=DEFAULT_DPI, client=None, max_workers=DEFAULT_PAGE_WORKERS, page_cache=False, render_pool=None, force_vision=False):
+    """
+    Yield the text of each page of a PDF as soon as it is extracted.
+
+    Takes the arguments of extract_pdf_text_with_mode() except output_path,
+    for the 'claude', 'gemini' and 'auto' modes. Pages come in page order,
+    each as soon as it and every page before it are done, so callers can
+    start on the first pages while later ones are still being rendered and
+    sent. Closing the generator early stops the extraction.
+
+    Yields:
+        tuple: (page_num, text, elapsed) with a 1-based page_num. elapsed is
+        the seconds spent on the page's request, or None for pages that
+        needed none (embedded text, page cache hits). Pages that failed
+        carry an error message instead of text, see contains_api_error();
+        only pages with an elapsed time can be such a failure.
+    """
+    mode, output_format, provider = _resolve_mode(mode, output_format, provider)
+    if mode in ('spacy', 'local'):
+        raise ValueError(f'iter_pdf_text_with_mode() does not support mode="{mode}"')
+    if provider not in _VISION_PROVIDERS:
+        raise ValueError(f'Unknown extraction mode: {mode}')
+    if not api_key and client is None:
+        raise ValueError(f'api_key is required when mode="{mode}"')
+    extract_batch, extract_page, as_bytes = _VISION_PROVIDERS[provider]
+
+    # Born-digital pages already carry their text; only render the rest
+    page_texts = _initial_page_texts(pdf_path, images, mode, force_vision)
+
+    # Reuse the client of earlier calls (unless the caller shares one)
+    if client is None:
+        client = shared_client(provider, api_key)
+
+    page_elapsed = {}
+    next_page = 0
+
+    def ready_pages():
+        nonlocal next_page
+        while next_page < len(page_texts) and page_texts[next_page] is not None:
+            text = page_texts[next_page]
+            # Drop the text once it has been handed out
+            page_texts[next_page] = ''
+            next_page += 1
+            yield next_page, text, page_elapsed.pop(next_page, None)
+
+    batches = _iter_vision_pages(
+        client, _vision_pages(pdf_path, images, page_texts, dpi, render_pool, as_bytes), page_texts, batch_pages,
+        extract_batch, extract_page, output_format, rate_limiter, progress_callback, max_workers,
+        extraction_config_key(provider, output_format, dpi=dpi) if page_cache else None
+    )
+    try:
+        for timings in batches:
+            page_elapsed.update(timings)
+            yield from ready_pages()
+        # Embedded-text and cached pages after the last request
+        yield from ready_pages()
+    finally:
+        batches.close()
 
-        # Convert PDF to images for Gemini vision API
-        images = pdf_to_images(pdf_path)
-        total_pages = len(images)
 
-        # Initialize Gemini client with new google-genai SDK
-        from google import genai
-        client = genai.Client(api_key=api_key)
+def extract_pdf_text(pdf_path, output_path, api_key, progress_callback=None):
+    return extract_pdf_text_with_mode(pdf_path, output_path, api_key=api_key, progress_callback=progress_callback, mode='claude')
 
-        for i, img_base64 in enumerate(images):
-            page_start = time.time()
 
-            if progress_callback:
-                progress_callback(i + 1, total_pages)
+def extract_pdf_text_with_mode(pdf_path, output_path, api_key=None, progress_callback=None, mode='claude', output_format='markdown', provider='claude', images=None, rate_limiter=None, batch_pages=1, dpi=DEFAULT_DPI, client=None, max_workers=DEFAULT_PAGE_WORKERS, page_cache=False, render_pool=None, force_vision=False):
+    """
+    Extract text from PDF using different modes.
 
-            text = extract_text_from_page_gemini(client, img_base64, i, output_format=output_format)
+    Args:
+        pdf_path: Path to input PDF
+        output_path: Path to output file (will contain markdown by default)
+        api_key: API key (Anthropic for Claude, Google for Gemini)
+        progress_callback: Optional callback function for progress updates
+        mode: 'claude' (default), 'gemini', 'auto' (embedded text where present,
+            Claude for the rest), or 'spacy'/'local' (layout-based extraction)
+        output_format: 'markdown' (default) or 'plain' - controls the extraction format
+        provider: 'claude' (default) or 'gemini' - which AI provider to use
+        images: Optional list of base64-encoded page images already produced by
+            pdf_to_images(). Only used by the AI modes; lets callers rasterize
+            ahead of time (e.g. in a separate pipeline stage). Pages whose
+            embedded text is used (see force_vision) may be None.
+        rate_limiter: Optional TokenBucket throttling the AI modes' API calls
+        batch_pages: Number of pages sent per vision API request (default 1).
+            If a batched request fails, its pages are retried one at a time.
+        dpi: Resolution pages are rendered at for the AI modes (default 150)
+        client: Optional client to reuse across calls: from make_claude_client()
+            for the Claude modes or make_gemini_client() for Gemini. If
+            omitted, shared_client() provides one per API key.
+        max_workers: Number of vision requests sent at once for this PDF
+            (default DEFAULT_PAGE_WORKERS). Pass 1 when the caller already
+            extracts several PDFs concurrently.
+        page_cache: If True, reuse the text of page images extracted by
+            earlier runs with the same provider and prompt, and cache new
+            pages (under ~/.cache/pdf-text-extractor/pages). Pages that
+            failed are not cached, so a rerun only pays for those.
+        render_pool: Optional make_render_pool() pool used to render the
+            pages when images is not given
+        force_vision: If True, the Claude and Gemini modes send every page to
+            the API even when the PDF is born-digital (see below)
+
+    mode: 'claude' (default), 'gemini', 'auto', or 'spacy'/'local' (layout-based extraction using spacy-layout)
+    If mode in ('claude', 'gemini', 'auto'), `api_key` must be provided.
+    The auto mode takes each page's embedded text layer when it has at least
+    NATIVE_TEXT_MIN_CHARS characters and only sends the remaining pages to Claude.
+    The claude and gemini modes do the same when at least NATIVE_PDF_MIN_SHARE
+    of the pages have such a text layer, unless force_vision is set. If mode == 'spacy'/'local', no API key is required.
+    The spacy mode uses the spacy-layout library with the en_core_web_sm model for layout-aware
+    text extraction from PDFs, including support for scanned documents via integrated OCR.
 
-            page_time = time.time() - page_start
-            page_timings.append((i + 1, page_time))
+    Returns:
+        tuple: (total_pages, page_timings, total_time) where page_timings is a list of (page_num, time_seconds)
+    """
 
-            # Check for API errors after each page
-            if contains_api_error(text):
-                failed_pages.append(i + 1)
-                # Skip this page but continue with the rest
-                continue
+    mode, output_format, provider = _resolve_mode(mode, output_format, provider)
 
-            all_text.append(f"<!-- PAGE {i + 1} -->\n{text}")
+    all_text = []
+    page_timings = []  # Track timing for each page
+    failed_pages = []  # Track failed page numbers
+    start_time = time.time()
+
+    if mode not in ('spacy', 'local') and provider in _VISION_PROVIDERS:
+        total_pages = 0
+        with _PageWriter(output_path) as writer:
+            for page_num, text, elapsed in iter_pdf_text_with_mode(
+                pdf_path, api_key, progress_callback, mode, output_format, provider, images,
+                rate_limiter, batch_pages, dpi, client, max_workers, page_cache, render_pool, force_vision
+            ):
+                # Only text from a request can be an error message
+                writer.write_page(page_num, text, requested=elapsed is not None)
+                total_pages = page_num
+                if elapsed is not None:
+                    page_timings.append((page_num, elapsed))
 
     elif mode in ('spacy', 'local'):
         # Use spacy-layout for PDF text extraction with layout awareness
         try:
-            import spacy
-            from spacy_layout import spaCyLayout
-
-            nlp = spacy.load("en_core_web_sm")
-            layout = spaCyLayout(nlp)
+            # The model is loaded once per process and reused
+            nlp, layout = get_spacy_layout()
 
             # Process the entire PDF with spaCyLayout
             doc = layout(pdf_path)
 
             # Get total pages for progress tracking
-            pdf_doc = fitz.open(pdf_path)
-            total_pages = len(pdf_doc)
-            pdf_doc.close()
+            import fitz  # PyMuPDF
+            with FITZ_LOCK, fitz.open(pdf_path, filetype='pdf') as pdf_doc:
+                total_pages = pdf_doc.page_count
 
             # Extract text, preserving page structure
             # spaCyLayout processes the whole document, so we need to split by pages
@@ -367,9 +1312,21 @@ def extract_pdf_text_with_mode(pdf_path, output_path, api_key=None, progress_cal
         except Exception as e:
             all_text.append(f"[Error extracting text: {e}]")
 
+        _write_output(output_path, all_text, failed_pages)
+
     else:
         raise ValueError(f'Unknown extraction mode: {mode}')
 
+    total_time = time.time() - start_time
+    return total_pages, page_timings, total_time
+
+
+def _write_output(output_path, all_text, failed_pages):
+    """
+    Write the extracted page blocks, headed by a warning if any pages failed.
+
+    Raises RuntimeError if every page failed.
+    """
     # Check if all pages failed
     if not all_text:
         error_msg = f"All pages failed during extraction. Failed pages: {', '.join(map(str, failed_pages))}"
@@ -383,8 +1340,186 @@ def extract_pdf_text_with_mode(pdf_path, output_path, api_key=None, progress_cal
         warning = f"⚠️  WARNING: The following pages failed to extract and were skipped: {', '.join(map(str, failed_pages))}\n\n"
         output_text = warning + output_text
 
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(output_text)
+    write_text(output_path, output_text)
 
-    total_time = time.time() - start_time
-    return total_pages, page_timings, total_time
+
+# Vision requests one PDF may have in flight at once on the asyncio path
+ASYNC_REQUESTS_PER_PDF = 4
+
+
+def make_claude_async_client(api_key):
+    """
+    Create an AsyncAnthropic client for extract_pdf_text_async().
+
+    Like make_claude_client(), it keeps HTTP/2 connections alive, but its
+    requests are awaited on an event loop instead of blocking a thread.
+    Use it from a single event loop.
+    """
+    from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+
+    http_client = DefaultAsyncHttpxClient(http2=True, limits=_http_limits())
+    return AsyncAnthropic(api_key=api_key, max_retries=CLIENT_MAX_RETRIES, http_client=http_client)
+
+
+async def _request_async(provider, client, content, output_format, max_tokens, rate_limiter, est_tokens):
+    """Send one vision request with an async client and return the response text."""
+    if rate_limiter:
+        # TokenBucket.acquire() sleeps, so wait for it off the event loop
+        await asyncio.to_thread(rate_limiter.acquire, est_tokens=est_tokens)
+
+    if provider == 'gemini':
+        response = await client.aio.models.generate_content(model=GEMINI_MODEL, contents=content)
+        return _gemini_text(response)
+
+    response = await client.messages.with_raw_response.create(
+        model=CLAUDE_MODEL,
+        max_tokens=max_tokens,
+        system=_claude_system(output_format),
+        messages=[{"role": "user", "content": content}]
+    )
+    if rate_limiter:
+        rate_limiter.update_from_headers(response.headers)
+    message = await response.parse()
+    return message.content[0].text
+
+
+async def extract_text_from_page_async(provider, client, image_base64, page_num, output_format='markdown', rate_limiter=None):
+    """
+    asyncio version of extract_text_from_page() / extract_text_from_page_gemini().
+
+    Args:
+        provider: 'claude' (client from make_claude_async_client()) or
+            'gemini' (client from make_gemini_client(); its .aio API is used)
+        image_base64, page_num, output_format, rate_limiter: As for
+            extract_text_from_page()
+    """
+    try:
+        content = _page_content(provider, image_base64, output_format)
+        text = await _request_async(provider, client, content, output_format, 4096, rate_limiter, EST_TOKENS_PER_PAGE)
+        # Inside the try, so an unusable response fails this page only
+        return _clean_page_text(text)
+    except Exception as e:
+        if is_fatal_api_error(e):
+            raise RuntimeError(f"API error on page {page_num + 1}: {e}") from e
+        return f"[Error extracting page {page_num + 1}: {e}]"
+
+
+async def extract_text_from_pages_async(provider, client, images_base64, first_page, output_format='markdown', rate_limiter=None):
+    """
+    asyncio version of extract_text_from_pages() / extract_text_from_pages_gemini().
+
+    Returns a list with the text of each page, or None if the request
+    failed or the response could not be split into one block per page.
+    """
+    count = len(images_base64)
+    try:
+        content = _batch_content(provider, images_base64, first_page, output_format)
+        text = await _request_async(provider, client, content, output_format, 4096 * count, rate_limiter, EST_TOKENS_PER_PAGE * count)
+    except Exception as e:
+        if is_fatal_api_error(e):
+            raise RuntimeError(f"API error on page {first_page + 1}: {e}") from e
+        return None
+
+    return _split_pages(text, first_page, count)
+
+
+async def extract_pdf_text_async(pdf_path, output_path, client, progress_callback=None, mode='claude', output_format='markdown', images=None, rate_limiter=None, batch_pages=1, dpi=DEFAULT_DPI, page_cache=False, max_requests=ASYNC_REQUESTS_PER_PDF, force_vision=False):
+    """
+    asyncio version of extract_pdf_text_with_mode() for the vision API modes.
+
+    The PDF's page batches are requested concurrently, at most
+    max_requests at a time; a failed batch is retried page by
+    page as in the threaded path. Pages are rendered on a worker thread as
+    request slots free up, so only the batches in flight are held in memory.
+
+    Args:
+        client: make_claude_async_client() for 'claude'/'auto', or
+            make_gemini_client() for 'gemini'
+        mode: 'claude' (default), 'gemini' or 'auto'
+        max_requests: Requests in flight at once for this PDF (default
+            ASYNC_REQUESTS_PER_PDF). Raise it when extracting a single large
+            PDF; one event loop can keep hundreds of requests open.
+        Other arguments and the return value are as for extract_pdf_text_with_mode().
+    """
+    mode = (mode or 'claude').lower()
+    output_format = (output_format or 'markdown').lower()
+    if mode not in ('claude', 'gemini', 'auto'):
+        raise ValueError(f'Unknown async extraction mode: {mode}')
+    provider = 'gemini' if mode == 'gemini' else 'claude'
+    start_time = time.time()
+
+    # Born-digital pages already carry their text; only render the rest
+    page_texts = await asyncio.to_thread(_initial_page_texts, pdf_path, images, mode, force_vision)
+    total_pages = len(page_texts)
+
+    page_timings = []
+    # Pages with embedded text count as done, as in _iter_vision_pages()
+    pages_done = total_pages - page_texts.count(None)
+    slots = asyncio.Semaphore(max(1, max_requests))
+
+    async def extract_batch(batch_start, batch):
+        # Runs holding a slot acquired by the loop below
+        nonlocal pages_done
+        try:
+            batch_time_start = time.time()
+            texts = None
+            if len(batch) > 1:
+                texts = await extract_text_from_pages_async(provider, client, batch, batch_start, output_format, rate_limiter)
+            if texts is None:
+                # Single page, or the batched request failed: one request per page
+                texts = [
+                    await extract_text_from_page_async(provider, client, img_base64, batch_start + offset, output_format, rate_limiter)
+                    for offset, img_base64 in enumerate(batch)
+                ]
+            # Spread the request time evenly over its pages
+            page_time = (time.time() - batch_time_start) / len(batch)
+            page_timings.extend((batch_start + offset + 1, page_time) for offset in range(len(batch)))
+        finally:
+            slots.release()
+
+        page_texts[batch_start:batch_start + len(texts)] = texts
+        if page_cache:
+            await asyncio.to_thread(_page_cache_store, cache_paths, batch_start, texts)
+        writer.write_ready(requested=range(batch_start, batch_start + len(texts)))
+        pages_done += len(batch)
+        if progress_callback:
+            progress_callback(pages_done, total_pages)
+
+    pages = _vision_pages(pdf_path, images, page_texts, dpi, as_bytes=_VISION_PROVIDERS[provider][2])
+    cache_paths = {}
+    if page_cache:
+        def cache_hit(i):
+            nonlocal pages_done
+            pages_done += 1
+            if progress_callback:
+                progress_callback(pages_done, total_pages)
+
+        cache_key = extraction_config_key(provider, output_format, dpi=dpi)
+        pages = _page_cache_lookup(pages, page_texts, cache_key, cache_paths, cache_hit)
+
+    # Rendering and cache lookups block, so the batch generator is advanced
+    # on worker threads, and only once a request slot is free
+    batches = _vision_batches(pages, batch_pages or 1)
+    tasks = []
+    with _PageWriter(output_path, page_texts) as writer:
+        try:
+            while True:
+                await slots.acquire()
+                # Stop sending pages once a request failed for good
+                failed = next((task for task in tasks if task.done() and task.exception()), None)
+                if failed is not None:
+                    slots.release()
+                    break
+                next_batch = await asyncio.to_thread(next, batches, None)
+                if next_batch is None:
+                    slots.release()
+                    break
+                tasks.append(asyncio.create_task(extract_batch(*next_batch)))
+            await asyncio.gather(*tasks)
+        finally:
+            # After an error, don't leave requests running for a dead extraction
+            for task in tasks:
+                task.cancel()
+    page_timings.sort()
+
+    return total_pages, page_timings, time.time() - start_time
@@ -4,17 +4,11 @@ Command-line interface for injecting OCR-based text into PDFs.
 
 import sys
 import os
-import argparse
 from .injector import inject_text_to_pdf
 
 
-def main():
-    """Main CLI entry point for pdf-inject command."""
-
-    parser = argparse.ArgumentParser(
-        description='Create searchable PDFs using spaCy Layout OCR',
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog='''
+# Examples shown by pdf-inject --help
+_EPILOG = '''
 Examples:
   # Create searchable PDF using OCR
   pdf-inject scan.pdf searchable.pdf
@@ -26,7 +20,24 @@ generated by pdf-extract are for human readability only.
 Requirements:
   pip install -e '.[local]'
   python -m spacy download en_core_web_sm
-        '''
+'''
+
+
+def main():
+    """Main CLI entry point for pdf-inject command."""
+
+    # Without arguments, show the examples without building the parser
+    if len(sys.argv) == 1:
+        print("usage: pdf-inject input_pdf output_pdf")
+        print(_EPILOG)
+        sys.exit(2)
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Create searchable PDFs using spaCy Layout OCR',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=_EPILOG
     )
 
     parser.add_argument('input_pdf', help='Input PDF file (scanned, no text layer)')
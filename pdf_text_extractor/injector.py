@@ -2,10 +2,17 @@
 Inject extracted text into PDFs as searchable layers using spaCy Layout OCR.
 """
 
-import fitz  # PyMuPDF
+import os
+from collections import defaultdict
+from .utils import fsync_path, b64decode, get_spacy_layout, FITZ_LOCK
 
+# Resolution the pages of a searchable PDF are rebuilt at
+PAGE_IMAGE_DPI = 144
+# JPEG quality of the rebuilt page images
+PAGE_IMAGE_JPEG_QUALITY = 85
 
-def inject_text_to_pdf(input_pdf, output_pdf):
+
+def inject_text_to_pdf(input_pdf, output_pdf, fsync=False, page_images=None):
     """
     Create a searchable PDF by adding invisible text layer using OCR.
 
@@ -14,77 +21,127 @@ def inject_text_to_pdf(input_pdf, output_pdf):
 
     Args:
         input_pdf: Path to input PDF (scanned, no text layer)
-        output_pdf: Path to output PDF (with searchable text)
+        output_pdf: Path to output PDF (with searchable text). May be the same
+            as input_pdf to replace the original.
+        fsync: If True, flush the saved PDF and its directory entry to disk
+            before returning, so it survives a crash or power loss.
+        page_images: Optional JPEGs of the pages, base64-encoded or as raw
+            bytes, as returned by pdf_to_images() for the vision API. Pages that have one are
+            rebuilt from it instead of being rendered again; they should be
+            at least PAGE_IMAGE_DPI.
     """
 
-    # Load spaCy and spaCy Layout for OCR
+    # Load spaCy and spaCy Layout for OCR (cached after the first call)
     try:
-        import spacy
-        from spacy_layout import spaCyLayout
+        nlp, layout_extractor = get_spacy_layout()
     except ImportError:
         raise ImportError(
             "pdf-inject requires spacy-layout. Install with: pip install -e '.[local]' && "
             "python -m spacy download en_core_web_sm"
         )
 
-    # Open input PDF
-    doc = fitz.open(input_pdf)
+    import fitz  # PyMuPDF
+
+    # Open input PDF. PyMuPDF is only used under FITZ_LOCK, since pdf-batch
+    # renders pages for the next PDF on another thread meanwhile.
+    with FITZ_LOCK:
+        doc = fitz.open(input_pdf)
+        num_pages = len(doc)
 
-    # Load spaCy model and process entire PDF with spaCy Layout
-    nlp = spacy.load("en_core_web_sm")
-    layout_extractor = spaCyLayout(nlp)
+    # Process entire PDF with spaCy Layout
     ocr_doc = layout_extractor(input_pdf)
 
-    # For each page, clear existing text and inject OCR-positioned text
-    for i, page in enumerate(doc):
-        # Create a new page from just the images (removes all text)
-        # Get the page's image content as pixmap
-        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x resolution
-
-        # Create a new PDF from this image
-        temp_doc = fitz.open()
-        temp_page = temp_doc.new_page(width=page.rect.width, height=page.rect.height)
-
-        # Insert the pixmap as image
-        temp_page.insert_image(page.rect, pixmap=pix)
-
-        # Replace the current page with the cleaned page
-        doc.delete_page(i)
-        doc.insert_pdf(temp_doc, from_page=0, to_page=0, start_at=i)
-        temp_doc.close()
-
-        # Get the newly inserted page
-        page = doc[i]
-
-        # Use OCR word positions for accurate text placement
-        # Filter tokens for current page
-        for token in ocr_doc:
-            # Check if token belongs to current page
-            if hasattr(token, 'page') and token.page == i + 1:  # Pages are 1-indexed in spacy-layout
-                if hasattr(token, 'x0') and hasattr(token, 'y0') and token.text.strip():
-                    # Get bounding box from OCR
-                    x0, y0, x1, y1 = token.x0, token.y0, token.x1, token.y1
-
-                    # Calculate font size from bounding box height
-                    bbox_height = y1 - y0
-                    fontsize = max(6, bbox_height * 0.75)
-
-                    # Insert invisible text at the word's position
-                    try:
-                        page.insert_text(
-                            (x0, y1),  # Bottom-left corner of text
-                            token.text,
-                            fontsize=fontsize,
-                            color=(0, 0, 0),
-                            render_mode=3  # Invisible
-                        )
-                    except Exception:
-                        # Skip if insertion fails
-                        pass
+    # Group the positioned OCR words by page in one sweep, instead of
+    # scanning every token for every page
+    tokens_by_page = defaultdict(list)
+    for token in ocr_doc:
+        if hasattr(token, 'page') and hasattr(token, 'x0') and hasattr(token, 'y0') and token.text.strip():
+            tokens_by_page[token.page].append(token)
+
+    # For each page, clear existing text and inject OCR-positioned text. The
+    # lock is taken per page, so other threads get a turn in between.
+    for i in range(num_pages):
+        with FITZ_LOCK:
+            page = doc[i]
+
+            # Create a new page from just the images (removes all text)
+            temp_doc = fitz.open()
+            temp_page = temp_doc.new_page(width=page.rect.width, height=page.rect.height)
+
+            if page_images and i < len(page_images) and page_images[i]:
+                # Reuse the image already rendered for text extraction
+                image = page_images[i]
+                temp_page.insert_image(page.rect, stream=b64decode(image) if isinstance(image, str) else image)
+            else:
+                # Render the page and embed it as JPEG. The encoded stream is
+                # stored as is (DCTDecode), where a pixmap would be Flate
+                # compressed again on insert. The pixmap is not kept in a
+                # variable, so it is freed right away instead of on the next page.
+                zoom = PAGE_IMAGE_DPI / 72
+                temp_page.insert_image(
+                    page.rect,
+                    stream=page.get_pixmap(matrix=fitz.Matrix(zoom, zoom)).tobytes("jpeg", jpg_quality=PAGE_IMAGE_JPEG_QUALITY)
+                )
+
+            # Replace the current page with the cleaned page
+            doc.delete_page(i)
+            doc.insert_pdf(temp_doc, from_page=0, to_page=0, start_at=i)
+            temp_doc.close()
+
+            # Get the newly inserted page
+            page = doc[i]
+
+            # Use OCR word positions for accurate text placement. All words of
+            # the page are drawn on one Shape and committed as a single content
+            # stream, rather than one stream per word.
+            shape = page.new_shape()
+            for token in tokens_by_page.get(i + 1, ()):  # Pages are 1-indexed in spacy-layout
+                # Get bounding box from OCR
+                x0, y0, x1, y1 = token.x0, token.y0, token.x1, token.y1
+
+                # Calculate font size from bounding box height
+                bbox_height = y1 - y0
+                fontsize = max(6, bbox_height * 0.75)
+
+                # Insert invisible text at the word's position
+                try:
+                    shape.insert_text(
+                        (x0, y1),  # Bottom-left corner of text
+                        token.text,
+                        fontsize=fontsize,
+                        color=(0, 0, 0),
+                        render_mode=3  # Invisible
+                    )
+                except Exception:
+                    # Skip if insertion fails
+                    pass
+            shape.commit()
 
     # Save with embedded text
-    num_pages = len(doc)
-    doc.save(output_pdf, garbage=4, deflate=True, clean=True)
-    doc.close()
+    if os.path.abspath(output_pdf) == os.path.abspath(input_pdf):
+        # PyMuPDF can't fully rewrite the file it has open, so write beside it
+        # and rename over it. Staying in the same directory keeps the rename
+        # atomic instead of degrading to a cross-filesystem copy. An
+        # incremental save would not help here: every page is rebuilt, and
+        # the old page images would stay in the file.
+        tmp_pdf = f"{output_pdf}.tmp"
+        try:
+            with FITZ_LOCK:
+                doc.save(tmp_pdf, garbage=4, deflate=True, clean=True)
+                doc.close()
+            os.replace(tmp_pdf, output_pdf)
+        except BaseException:
+            try:
+                os.unlink(tmp_pdf)
+            except FileNotFoundError:
+                pass
+            raise
+    else:
+        with FITZ_LOCK:
+            doc.save(output_pdf, garbage=4, deflate=True, clean=True)
+            doc.close()
+
+    if fsync:
+        fsync_path(output_pdf)
 
     return num_pages
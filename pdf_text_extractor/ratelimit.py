@@ -0,0 +1,96 @@
+"""
+Client-side rate limiting for vision API calls.
+"""
+
+import threading
+import time
+
+# Rough token usage of one page, matching the numbers in estimate_cost():
+# ~2,000 input tokens for the page image + ~750 output tokens of text
+EST_TOKENS_PER_PAGE = 2750
+
+# Response headers Anthropic uses to report remaining capacity
+_REQUESTS_REMAINING_HEADER = 'anthropic-ratelimit-requests-remaining'
+_TOKENS_REMAINING_HEADER = 'anthropic-ratelimit-tokens-remaining'
+
+
+class TokenBucket:
+    """
+    Proactive limiter for requests-per-minute and tokens-per-minute budgets.
+
+    Both budgets refill continuously. acquire() blocks until enough capacity
+    is available, so concurrent workers stay under the provider's limits
+    instead of tripping them and waiting in retry backoff. A limit of None
+    disables that budget.
+    """
+
+    def __init__(self, requests_per_min=None, tokens_per_min=None):
+        self.requests_per_min = requests_per_min
+        self.tokens_per_min = tokens_per_min
+        self._requests = float(requests_per_min or 0)
+        self._tokens = float(tokens_per_min or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """Add the capacity earned since the last call. Caller holds the lock."""
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+
+        if self.requests_per_min:
+            self._requests = min(self.requests_per_min, self._requests + elapsed * self.requests_per_min / 60)
+        if self.tokens_per_min:
+            self._tokens = min(self.tokens_per_min, self._tokens + elapsed * self.tokens_per_min / 60)
+
+    def acquire(self, requests=1, est_tokens=EST_TOKENS_PER_PAGE):
+        """Block until `requests` requests and `est_tokens` tokens can be spent."""
+        # A single call can never need more than a full bucket
+        if self.requests_per_min:
+            requests = min(requests, self.requests_per_min)
+        if self.tokens_per_min:
+            est_tokens = min(est_tokens, self.tokens_per_min)
+
+        while True:
+            with self._lock:
+                self._refill()
+
+                wait = 0.0
+                if self.requests_per_min and self._requests < requests:
+                    wait = max(wait, (requests - self._requests) * 60 / self.requests_per_min)
+                if self.tokens_per_min and self._tokens < est_tokens:
+                    wait = max(wait, (est_tokens - self._tokens) * 60 / self.tokens_per_min)
+
+                if wait == 0.0:
+                    self._requests -= requests
+                    self._tokens -= est_tokens
+                    return
+
+            time.sleep(wait)
+
+    def update_from_headers(self, headers):
+        """
+        Sync the buckets with the remaining capacity reported by the API.
+
+        Only ever lowers the local estimate: the server knows about usage
+        from other clients sharing the same key.
+        """
+        if not headers:
+            return
+
+        with self._lock:
+            self._refill()
+            requests_remaining = _parse_int(headers.get(_REQUESTS_REMAINING_HEADER))
+            tokens_remaining = _parse_int(headers.get(_TOKENS_REMAINING_HEADER))
+            if self.requests_per_min and requests_remaining is not None:
+                self._requests = min(self._requests, requests_remaining)
+            if self.tokens_per_min and tokens_remaining is not None:
+                self._tokens = min(self._tokens, tokens_remaining)
+
+
+def _parse_int(value):
+    """Parse a header value as an int, returning None if missing or invalid."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
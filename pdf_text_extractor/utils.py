@@ -2,7 +2,59 @@
 Utility functions shared across the package.
 """
 
+import base64
+import functools
+import os
 import re
+import shutil
+import threading
+
+try:
+    # SIMD-accelerated base64 from the optional `fast` extra
+    import pybase64
+except ImportError:
+    pybase64 = None
+
+# PyMuPDF is not thread-safe, so only one thread per process may use it at a
+# time: every fitz call in this package holds this lock, whether it runs on
+# the main thread, the render prefetch thread or a pdf-batch stage. Render
+# pools are separate processes, each with a lock of its own. Reentrant so
+# helpers that take it can call each other.
+FITZ_LOCK = threading.RLock()
+
+
+# Inline markdown, removed in a single pass by _strip_inline(). Each
+# alternative captures the text to keep; longer markers come before their
+# prefixes since alternatives are tried left to right.
+_INLINE_RE = re.compile(
+    r'!\[([^\]]*)\]\([^\)]+\)'    # Images ![alt](url) -> alt
+    r'|\[([^\]]+)\]\([^\)]+\)'    # Links [text](url) -> text
+    r'|\*\*\*(.+?)\*\*\*'         # Bold italic
+    r'|\*\*(.+?)\*\*'             # Bold
+    r'|\*(?!\s)(.+?)(?<!\s)\*'      # Italic, not a list marker or "2 * 3"
+    r'|___(.+?)___'               # Bold italic
+    r'|__(.+?)__'                 # Bold
+    r'|(?<!\w)_(.+?)_(?!\w)'       # Italic, not snake_case
+    r'|~~(.+?)~~'                 # Strikethrough
+    r'|`(.+?)`'                   # Inline code
+)
+
+# Table alignment rows such as |---|:---:|
+_TABLE_ALIGN_RE = re.compile(r'^\s*\|[\s\-\|:]+\|\s*$')
+
+# Characters a horizontal rule (---, ***, ___) is made of
+_HR_CHARS = '-*_'
+
+
+def _inline_repl(match):
+    """_INLINE_RE replacement: the kept text, with any markup nested inside it removed."""
+    inner = match.group(match.lastindex)
+    return _strip_inline(inner) if inner else inner
+
+
+def _strip_inline(text):
+    """Remove inline markdown (emphasis, strikethrough, code, links, images), keeping the text."""
+    return _INLINE_RE.sub(_inline_repl, text)
 
 
 def markdown_to_plain_text(markdown_text):
@@ -18,63 +70,211 @@ def markdown_to_plain_text(markdown_text):
     Returns:
         Plain text version with markdown syntax removed
     """
-    text = markdown_text
+    # One pass over the lines: each line is checked against the line-level
+    # markup by cheap prefix tests, in the order the rules apply
+    plain_lines = []
+    in_code_fence = False
+    for line in markdown_text.split('\n'):
+        # Drop code fences and keep the code between them as it is
+        if line.lstrip().startswith('```'):
+            in_code_fence = not in_code_fence
+            continue
+        if not in_code_fence:
+            line = _plain_line(line)
+            if line is None:
+                continue
 
-    # Remove bold/italic (** and * and __)
-    text = re.sub(r'\*\*\*(.+?)\*\*\*', r'\1', text)  # Bold italic
-    text = re.sub(r'\*\*(.+?)\*\*', r'\1', text)       # Bold
-    text = re.sub(r'\*(.+?)\*', r'\1', text)           # Italic
-    text = re.sub(r'___(.+?)___', r'\1', text)         # Bold italic
-    text = re.sub(r'__(.+?)__', r'\1', text)           # Bold
-    text = re.sub(r'_(.+?)_', r'\1', text)             # Italic
+        # Clean up multiple blank lines
+        if not line and plain_lines and not plain_lines[-1]:
+            continue
+        plain_lines.append(line)
 
-    # Remove strikethrough
-    text = re.sub(r'~~(.+?)~~', r'\1', text)
+    return '\n'.join(plain_lines).strip()
 
-    # Remove inline code
-    text = re.sub(r'`(.+?)`', r'\1', text)
 
-    # Remove links but keep text [text](url) -> text
-    text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
+def _plain_line(line):
+    """
+    Remove the markdown from one line outside a code block.
 
-    # Remove images ![alt](url) -> alt
-    text = re.sub(r'!\[([^\]]*)\]\([^\)]+\)', r'\1', text)
+    Returns None for lines that disappear entirely (table alignment rows).
+    """
+    # Remove bold/italic, strikethrough, inline code, links and images
+    line = _strip_inline(line)
 
     # Remove heading markers (# ## ###)
-    text = re.sub(r'^#{1,6}\s+', '', text, flags=re.MULTILINE)
+    if line.startswith('#'):
+        rest = line.lstrip('#')
+        if len(line) - len(rest) <= 6 and rest[:1].isspace():
+            line = rest.lstrip()
 
     # Remove blockquote markers
-    text = re.sub(r'^>\s+', '', text, flags=re.MULTILINE)
+    if line.startswith('>') and line[1:2].isspace():
+        line = line[1:].lstrip()
 
     # Remove horizontal rules
-    text = re.sub(r'^[\-\*_]{3,}\s*$', '', text, flags=re.MULTILINE)
+    if line and line[0] in _HR_CHARS:
+        rule = line.rstrip()
+        if len(rule) >= 3 and not rule.strip(_HR_CHARS):
+            return ''
 
     # Remove list markers but preserve indentation
-    text = re.sub(r'^(\s*?)[\*\-\+]\s+', r'\1', text, flags=re.MULTILINE)
-    text = re.sub(r'^(\s*?)\d+\.\s+', r'\1', text, flags=re.MULTILINE)
-
-    # Remove code block markers
-    text = re.sub(r'^```[^\n]*\n', '', text, flags=re.MULTILINE)
-    text = re.sub(r'^```\s*$', '', text, flags=re.MULTILINE)
+    item = line.lstrip()
+    indent = line[:len(line) - len(item)]
+    if item[:1] in ('*', '-', '+') and item[1:2].isspace():
+        item = item[1:].lstrip()
+        line = indent + item
+    if item[:1].isdigit():
+        number = item.lstrip('0123456789')
+        if number[:1] == '.' and number[1:2].isspace():
+            line = indent + number[1:].lstrip()
 
     # Remove table formatting - convert to plain text
     # Keep the content but remove the pipe separators and alignment rows
-    lines = text.split('\n')
-    cleaned_lines = []
-    for line in lines:
-        # Skip table alignment rows (|---|---|)
-        if re.match(r'^\s*\|[\s\-\|:]+\|\s*$', line):
-            continue
-        # Clean pipe separators from table rows
-        if '|' in line and line.strip().startswith('|'):
-            # Remove leading/trailing pipes and split
-            cells = [cell.strip() for cell in line.split('|')[1:-1]]
-            cleaned_lines.append('  '.join(cells))
+    if line.lstrip().startswith('|'):
+        if _TABLE_ALIGN_RE.match(line):
+            return None
+        # Remove leading/trailing pipes and join the cells
+        cells = [cell.strip() for cell in line.split('|')[1:-1]]
+        line = '  '.join(cells)
+    return line
+
+
+# spaCy pipeline used by the local extraction mode and by pdf-inject
+SPACY_MODEL = "en_core_web_sm"
+
+
+@functools.lru_cache(maxsize=2)
+def get_spacy_layout(model=SPACY_MODEL):
+    """
+    Load a spaCy model and wrap it in spaCyLayout, once per process.
+
+    Loading the model takes seconds, so the pair is cached and shared by
+    every later extraction and injection.
+
+    Returns:
+        tuple: (nlp, layout) where layout(pdf_path) returns a layout Doc
+
+    Raises:
+        ImportError: If spacy or spacy-layout is not installed
+        OSError: If the model is not installed
+    """
+    import spacy
+    from spacy_layout import spaCyLayout
+
+    nlp = spacy.load(model)
+    return nlp, spaCyLayout(nlp)
+
+
+def head_tail_bytes(path, head=8192, tail=2048):
+    """
+    Read only the start and end of a file, as bytes.
+
+    Files no larger than head + tail are returned whole.
+
+    Args:
+        path: File to read
+        head: Number of bytes to read from the start
+        tail: Number of bytes to read from the end
+
+    Returns:
+        The head and tail joined by a newline, or the whole file
+    """
+    with open(path, 'rb') as f:
+        data = f.read(head)
+        size = os.fstat(f.fileno()).st_size
+        if size > head + tail:
+            f.seek(size - tail, os.SEEK_SET)
+            data += b'\n' + f.read(tail)
         else:
-            cleaned_lines.append(line)
-    text = '\n'.join(cleaned_lines)
+            # Small enough to read whole, without a newline spliced in
+            data += f.read()
+    return data
+
+
+def write_text(path, text):
+    """
+    Write a whole text file as UTF-8 with os.write().
+
+    The text is encoded once and handed to the kernel directly, skipping
+    the io buffering and incremental encoder layers used by open(..., 'w').
+
+    Args:
+        path: File to create or truncate
+        text: Full file contents
+    """
+    data = memoryview(text.encode('utf-8'))
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while data:
+            # os.write() may write less than asked for
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+
+def fsync_path(path):
+    """
+    Flush a file and the directory entry naming it to stable storage.
+
+    Call after writing or renaming a file whose loss on power failure would
+    matter. The directory fsync is skipped on platforms that can't open
+    directories (Windows).
+
+    Args:
+        path: File to flush
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def fast_copy(src, dst):
+    """
+    Copy a file's contents, letting the kernel move the bytes where possible.
+
+    On Linux this uses os.copy_file_range(), which clones extents on reflink
+    filesystems (btrfs, XFS) instead of reading and writing the data. Falls
+    back to shutil.copyfile() on other platforms or if the kernel refuses.
+
+    Args:
+        src: File to copy
+        dst: Destination path (overwritten if it exists)
+    """
+    if hasattr(os, 'copy_file_range'):
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            if remaining == 0:
+                return
+        except OSError:
+            # e.g. EXDEV on older kernels or filesystems without support
+            pass
+
+    shutil.copyfile(src, dst)
+
+
+def b64encode_str(data):
+    """Base64-encode bytes straight to a str, using pybase64 when it is installed."""
+    if pybase64 is not None:
+        return pybase64.b64encode_as_string(data)
+    return base64.b64encode(data).decode('ascii')
 
-    # Clean up multiple blank lines
-    text = re.sub(r'\n{3,}', '\n\n', text)
 
-    return text.strip()
+def b64decode(data):
+    """Decode a base64 str, using pybase64 when it is installed."""
+    if pybase64 is not None:
+        return pybase64.b64decode(data, validate=True)
+    return base64.b64decode(data)